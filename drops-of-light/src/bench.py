@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tracemalloc
+from budget import Budget
+from state import State
+from solver import Solver
+
+# Algorithms benchmarked by default, the solve_<name> methods of Solver that run in this process
+ALGORITHMS = ["astar", "idastar", "bfs", "bidirectional", "ids", "arastar"]
+
+# Metrics compared against the baseline: (name, True if higher is better)
+METRICS = [("median", False), ("p95", False), ("rate", True)]
+
+
+# Parse the command line arguments
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python bench.py",
+        description="Benchmark the solvers on every level and compare them with a baseline.",
+    )
+    parser.add_argument(
+        "-a",
+        "--algorithms",
+        nargs="+",
+        default=ALGORITHMS,
+        help="solve_<name> methods to benchmark (default: %(default)s)",
+    )
+    parser.add_argument("-l", "--levels", default="levels", help="directory with the levels")
+    parser.add_argument("-r", "--repetitions", type=int, default=5)
+    parser.add_argument("-t", "--time", type=float, default=5, help="time limit per search")
+    parser.add_argument("-b", "--baseline", default="bench_baseline.json")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="relative change of a metric that is reported as a regression",
+    )
+    parser.add_argument(
+        "--patterns", action="store_true", help="use the pattern database heuristic"
+    )
+    parser.add_argument(
+        "--symmetries", action="store_true", help="merge symmetric boards into one state"
+    )
+    parser.add_argument(
+        "--save", action="store_true", help="store the results as the new baseline"
+    )
+    return parser.parse_args(argv)
+
+
+# Level directories, in numerical order when they are numbered
+def find_levels(directory):
+    names = [
+        name
+        for name in os.listdir(directory)
+        if os.path.isfile(os.path.join(directory, name, "initial.txt"))
+    ]
+    names.sort(key=lambda name: (not name.isdigit(), int(name) if name.isdigit() else name))
+    return [os.path.join(directory, name) for name in names]
+
+
+# Percentile of a list of values, interpolated between the closest ranks
+def percentile(values, p):
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (k - low)
+
+
+# Run a search once, return its solver and solution path
+def run(directory, algorithm, seconds):
+    state = State()
+    state.load_level(directory)
+
+    solver = Solver(state, Budget(time=seconds))
+    return solver, solver.get_solution(getattr(solver, f"solve_{algorithm}")())
+
+
+# Benchmark an algorithm on a level
+# Times come from the repetitions, peak memory (traced Python allocations) from one extra run,
+# since tracing allocations slows the search down
+def benchmark(directory, algorithm, repetitions, seconds):
+    times = []
+    rates = []
+
+    for _ in range(repetitions):
+        solver, path = run(directory, algorithm, seconds)
+        times.append(solver.stats.elapsed)
+        rates.append(solver.stats.rate())
+
+    tracemalloc.start()
+    run(directory, algorithm, seconds)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "solved": path is not None,
+        "reason": solver.result.reason,
+        "length": None if path is None else len(path),
+        "median": statistics.median(times),
+        "p95": percentile(times, 95),
+        "rate": statistics.median(rates),
+        "memory": peak / 2**20,
+    }
+
+
+# Compare the results with the baseline, return the list of regressions
+def compare(results, baseline, tolerance):
+    regressions = []
+
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+
+        if base["solved"] and not result["solved"]:
+            regressions.append(f"{name}: no longer solved ({result['reason']})")
+            continue
+
+        if base["solved"] and result["length"] > base["length"]:
+            regressions.append(f"{name}: solution length {base['length']} -> {result['length']}")
+
+        for metric, higher in METRICS:
+            old, new = base[metric], result[metric]
+            if not old:
+                continue
+
+            change = (new - old) / old
+            if (change < -tolerance) if higher else (change > tolerance):
+                regressions.append(f"{name}: {metric} {old:.4g} -> {new:.4g} ({change:+.0%})")
+
+    return regressions
+
+
+# Entry point of the benchmark
+def main(argv=None):
+    args = parse_args(argv)
+    State.use_patterns = args.patterns
+    State.use_symmetries = args.symmetries
+    results = {}
+
+    print(
+        f"{'level':<12} {'algorithm':<14} {'solved':<7} {'length':>6} {'median':>9} "
+        f"{'p95':>9} {'nodes/s':>10} {'memory':>9}"
+    )
+
+    for directory in find_levels(args.levels):
+        for algorithm in args.algorithms:
+            result = benchmark(directory, algorithm, args.repetitions, args.time)
+            results[f"{os.path.basename(directory)}/{algorithm}"] = result
+
+            print(
+                f"{os.path.basename(directory):<12} {algorithm:<14} {str(result['solved']):<7} "
+                f"{result['length'] if result['solved'] else '-':>6} {result['median']:>8.3f}s "
+                f"{result['p95']:>8.3f}s {result['rate']:>10.0f} {result['memory']:>7.1f}MB"
+            )
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.isfile(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save to create one")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+
+    if not regressions:
+        print("No regressions against the baseline")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
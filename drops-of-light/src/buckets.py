@@ -0,0 +1,52 @@
+import heapq as pq
+
+
+# Define a priority queue of items grouped in buckets of equal priority
+# Evaluations only take a few distinct values, so each push and pop is O(1) within a bucket,
+# and the heap of priorities only changes when a bucket is created or emptied
+# Items of a bucket are popped last in, first out, so among equal evaluations the newest
+# (usually deepest) node comes first and items are never compared with each other
+class BucketQueue:
+    # Initialize an empty queue
+    def __init__(self):
+        self.buckets = {}
+        self.priorities = []
+        self.size = 0
+
+    # Add an item with the given priority
+    def push(self, priority, item):
+        bucket = self.buckets.get(priority)
+        if bucket is None:
+            bucket = self.buckets[priority] = []
+            pq.heappush(self.priorities, priority)
+
+        bucket.append(item)
+        self.size += 1
+
+    # Remove and return the item with the lowest priority, as (priority, item)
+    def pop(self):
+        priority = self.priorities[0]
+        bucket = self.buckets[priority]
+        item = bucket.pop()
+
+        if not bucket:
+            del self.buckets[priority]
+            pq.heappop(self.priorities)
+
+        self.size -= 1
+        return priority, item
+
+    # Return the item with the lowest priority without removing it, as (priority, item)
+    def peek(self):
+        priority = self.priorities[0]
+        return priority, self.buckets[priority][-1]
+
+    # Iterate over the items in no particular order, as (priority, item)
+    def items(self):
+        for priority, bucket in self.buckets.items():
+            for item in bucket:
+                yield priority, item
+
+    # Number of items in the queue
+    def __len__(self):
+        return self.size
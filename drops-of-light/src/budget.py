@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+
+# The resource module is only available on Unix systems
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Reasons for a search to stop
+SOLVED = "solved"  # The search ran to completion and found a solution
+EXHAUSTED = "exhausted"  # The search ran out of states without finding a solution
+TIME = "time"
+NODES = "nodes"
+MEMORY = "memory"
+CANCELLED = "cancelled"
+
+
+# Define the limits of a search
+# Wall time in seconds, number of expanded nodes and resident memory in megabytes (None for no limit)
+# The memory limit applies to the memory the search adds to the process, measured from its start,
+# so that a large search does not leave later searches of the same process over the limit
+# The limits are only checked every `every` expansions, to keep the clock and the memory usage
+# out of the inner loop of the searches
+class Budget:
+    # Initialize the budget, by default the 15 seconds the solvers always had
+    def __init__(self, time=15, nodes=None, memory=None, every=256):
+        self.time = time
+        self.nodes = nodes
+        self.memory = memory
+        self.every = every
+        self.start = None
+        self.baseline = None
+
+    # Start counting the time and the memory of a new search
+    def begin(self):
+        self.start = time.time()
+        self.baseline = self.resident() if self.memory is not None else None
+
+    # Time elapsed since the search started, in seconds
+    def elapsed(self):
+        return time.time() - self.start
+
+    # Current resident memory of the process in megabytes (None if it cannot be measured)
+    # Read from /proc where there is one, otherwise the peak resident memory is the best measure
+    def resident(self):
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+        except (OSError, ValueError, IndexError, AttributeError):
+            pass
+
+        if resource is None:
+            return None
+
+        # ru_maxrss is in bytes on macOS and in kilobytes on the other Unix systems
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+    # Check the limits, return the reason to stop or None if the search can go on
+    # The node limit is skipped if nodes is not set, for searches that only report the nodes of finished ones
+    def exceeded(self, expanded, nodes=True):
+        if self.time is not None and self.elapsed() > self.time:
+            return TIME
+
+        if nodes and self.nodes is not None and expanded >= self.nodes:
+            return NODES
+
+        if self.memory is not None:
+            resident = self.resident()
+            if resident is not None and resident - (self.baseline or 0) > self.memory:
+                return MEMORY
+
+        return None
+
+
+# Define the outcome of a search
+# If the search did not find a solution, state is the closest state to the goal (lowest heuristic)
+# among the ones seen when checking the budget, so that a partial result is still available
+class SearchResult:
+    # Initialize an empty result
+    def __init__(self):
+        self.state = None
+        self.solved = False
+        self.h = None
+        self.bound = None
+        self.reason = None
+        self.expanded = 0
+        self.elapsed = 0
+        self.cached = False  # The solution came from the solution cache, no search was run
+
+    # Consider a state as the best so far
+    def offer(self, state):
+        h = state.heuristic()
+        if self.h is None or h < self.h:
+            self.h = h
+            self.state = state.deepcopy()
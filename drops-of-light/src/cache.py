@@ -0,0 +1,85 @@
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+
+
+# Define a persistent cache of solutions, evicting the least recently used ones
+# Solutions are stored as lists of moves (u, v, packed colors) from the problem, under a key
+# that describes the problem and the algorithm (see Solver.cache_key)
+# The file is read on first use and written after every change
+class SolutionCache:
+    # Initialize the cache, stored in the given file and holding at most capacity solutions
+    def __init__(self, path="solutions.pickle", capacity=256):
+        self.path = path
+        self.capacity = capacity
+        self.entries = None
+
+    # Read the entries from the file, starting empty if there is no valid file
+    def load(self):
+        self.entries = OrderedDict()
+
+        if self.path is None or not os.path.isfile(self.path):
+            return
+
+        try:
+            with open(self.path, "rb") as f:
+                entries = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return
+
+        if isinstance(entries, OrderedDict):
+            self.entries = entries
+
+    # Write the entries to the file, replacing it atomically
+    def save(self):
+        if self.path is None:
+            return
+
+        temporary = f"{self.path}.{os.getpid()}"
+        try:
+            with open(temporary, "wb") as f:
+                pickle.dump(self.entries, f)
+            os.replace(temporary, self.path)
+        except OSError:
+            pass
+
+    # Get the solution stored under a key (None if there is none), marking it as recently used
+    def get(self, key):
+        if self.entries is None:
+            self.load()
+
+        if key not in self.entries:
+            return None
+
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    # Store a solution under a key, evicting the least recently used ones beyond the capacity
+    def put(self, key, moves):
+        if self.entries is None:
+            self.load()
+
+        self.entries[key] = moves
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+        self.save()
+
+    # Remove every solution
+    def clear(self):
+        self.entries = OrderedDict()
+        self.save()
+
+    # Number of solutions stored
+    def __len__(self):
+        if self.entries is None:
+            self.load()
+        return len(self.entries)
+
+
+# Digest of the values that identify a problem and the way it is solved
+def digest(*values):
+    return hashlib.sha1(repr(values).encode()).hexdigest()
@@ -0,0 +1,180 @@
+import argparse
+import csv
+import json
+import sys
+from budget import Budget
+from cache import SolutionCache
+from state import State
+from solver import Solver
+
+# Algorithms that can be run from the command line, each is the solve_<name> method of Solver
+ALGORITHMS = [
+    "astar",
+    "bfs",
+    "bidirectional",
+    "ids",
+    "idastar",
+    "portfolio",
+    "hdastar",
+    "arastar",
+]
+
+# Columns of the CSV report
+FIELDS = [
+    "level",
+    "algorithm",
+    "solved",
+    "reason",
+    "cached",
+    "length",
+    "energy",
+    "winner",
+    "expanded",
+    "generated",
+    "duplicates",
+    "energy_pruned",
+    "bound_pruned",
+    "peak_frontier",
+    "eval_time",
+    "gen_time",
+    "copy_time",
+    "elapsed",
+    "solution",
+]
+
+
+# Parse the command line arguments
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m solver",
+        description="Solve Drops of Light levels without the graphical interface.",
+    )
+    parser.add_argument(
+        "levels", nargs="+", help="level directories, with initial.txt and goal.txt"
+    )
+    parser.add_argument(
+        "-a",
+        "--algorithms",
+        nargs="+",
+        choices=ALGORITHMS,
+        default=["astar"],
+        help="algorithms to run on every level (default: astar)",
+    )
+    parser.add_argument(
+        "-t", "--time", type=float, default=15, help="time limit per search, in seconds"
+    )
+    parser.add_argument("-n", "--nodes", type=int, help="expanded nodes limit per search")
+    parser.add_argument(
+        "-m", "--memory", type=float, help="resident memory a search may add, in megabytes"
+    )
+    parser.add_argument(
+        "-w", "--weight", type=float, default=State.weight, help="heuristic weight"
+    )
+    parser.add_argument(
+        "-p",
+        "--patterns",
+        action="store_true",
+        help="combine the heuristic with per-color pattern databases, cached in the level directories",
+    )
+    parser.add_argument(
+        "-s",
+        "--symmetries",
+        action="store_true",
+        help="merge boards that a symmetry of the graph fixing the pigments and the goal maps onto each other",
+    )
+    parser.add_argument(
+        "-c", "--cache", help="solution cache file, solved problems are looked up there first"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="profile every search with cProfile and write its most expensive functions to standard error",
+    )
+    parser.add_argument("-f", "--format", choices=["json", "csv"], default="json")
+    parser.add_argument("-o", "--output", help="output file (default: standard output)")
+    return parser.parse_args(argv)
+
+
+# Solve a level with an algorithm and describe the outcome
+# If profile is set, the profile of the search is written to standard error
+def solve(directory, algorithm, budget, cache=None, profile=False):
+    state = State()
+    state.load_level(directory)
+
+    solver = Solver(state, budget, profile, cache)
+    path = solver.get_solution(solver.solve(f"solve_{algorithm}"))
+    result = solver.result
+
+    if profile:
+        sys.stderr.write(f"Profile of {algorithm} on {directory}\n{solver.stats.top()}\n")
+
+    winner = None
+    if solver.winner is not None:
+        winner = f"{solver.winner[0]} (weight {solver.winner[1]})"
+
+    return {
+        "level": directory,
+        "algorithm": algorithm,
+        "solved": path is not None,
+        "reason": result.reason,
+        "cached": result.cached,
+        "length": None if path is None else len(path),
+        "energy": None if path is None else (path[-1][4] if path else state.energy),
+        "winner": winner,
+        "solution": None
+        if path is None
+        else [{"from": u, "to": v, "colors": colors} for _, u, v, colors, _ in path],
+        "stats": solver.stats.as_dict(),
+    }
+
+
+# Write the reports as JSON
+def write_json(reports, output):
+    json.dump(reports, output, indent=2)
+    output.write("\n")
+
+
+# Write the reports as CSV, one row per search, the solution as "from-to:colors" moves
+def write_csv(reports, output):
+    writer = csv.DictWriter(output, fieldnames=FIELDS)
+    writer.writeheader()
+
+    for report in reports:
+        row = {key: value for key, value in report.items() if key in FIELDS}
+        row.update(report["stats"])
+
+        if report["solution"] is not None:
+            row["solution"] = " ".join(
+                f"{move['from']}-{move['to']}:{''.join(map(str, move['colors']))}"
+                for move in report["solution"]
+            )
+
+        writer.writerow(row)
+
+
+# Entry point of the headless solver
+def main(argv=None):
+    args = parse_args(argv)
+    State.weight = args.weight
+    State.use_patterns = args.patterns
+    State.use_symmetries = args.symmetries
+
+    cache = None if args.cache is None else SolutionCache(args.cache)
+
+    reports = []
+    for directory in args.levels:
+        for algorithm in args.algorithms:
+            budget = Budget(args.time, args.nodes, args.memory)
+            reports.append(solve(directory, algorithm, budget, cache, args.profile))
+
+    write = write_json if args.format == "json" else write_csv
+
+    if args.output is None:
+        write(reports, sys.stdout)
+    else:
+        with open(args.output, "w", newline="") as f:
+            write(reports, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import argparse
+import random
+from graph import BOARD, Graph, hex_grid
+from state import State
+from utils import *
+
+
+# Parse the command line arguments
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python generator.py",
+        description="Generate solvable Drops of Light levels by random walks of legal moves.",
+    )
+    parser.add_argument("output", help="directory where the levels are written, one per subdirectory")
+    parser.add_argument("-c", "--count", type=int, default=1, help="number of levels to generate")
+    parser.add_argument("-d", "--drops", type=int, default=8, help="primary colors on the board")
+    parser.add_argument("-p", "--pigments", type=int, default=2, help="pigments on the board")
+    parser.add_argument("--depth", type=int, default=10, help="moves of the random walk")
+    parser.add_argument(
+        "--slack", type=int, default=0, help="energy given on top of the energy used by the walk"
+    )
+    parser.add_argument("-g", "--graph", help="graph file of the levels (default: the original board)")
+    parser.add_argument(
+        "--hex",
+        nargs=2,
+        type=int,
+        metavar=("ROWS", "COLS"),
+        help="play the levels on a hexagonal grid instead",
+    )
+    parser.add_argument("-s", "--seed", type=int, help="seed of the random number generator")
+    return parser.parse_args(argv)
+
+
+# Place the pigments and the drops on random vertices of an empty state
+# A vertex holds at most one pigment and a drop never shares a primary color with its vertex
+def scatter(state, drops, pigments, rng):
+    if pigments > state.n:
+        raise ValueError(f"At most {state.n} pigments fit on the board")
+    if drops > 3 * state.n - pigments:
+        raise ValueError(f"At most {3 * state.n - pigments} drops fit with {pigments} pigments")
+
+    graph = [set() for _ in range(state.n)]
+
+    for u in rng.sample(range(state.n), pigments):
+        graph[u].add(-rng.randint(1, 3))
+
+    # Every free (vertex, color) slot, a drop takes one of them
+    free = [
+        (u, color)
+        for u in range(state.n)
+        for color in (1, 2, 3)
+        if color not in graph[u] and -color not in graph[u]
+    ]
+    for u, color in rng.sample(free, drops):
+        graph[u].add(color)
+
+    state.board, state.pigments = pack_graph(graph)
+    state.initial_board = state.board
+    state.masks = color_masks(state.board, state.n)
+
+
+# Random walk of legal moves from the current board, never going back to a board already visited
+# Stops early if every move leads to a visited board, returns the energy used by the walk
+def walk(state, depth, rng):
+    state.energy = 0
+    visited = {state.board}
+
+    for _ in range(depth):
+        moves = [
+            (u, v, mask)
+            for u, v, mask in state.gen_moves()
+            if state.board ^ ((mask << (BITS * u)) | (mask << (BITS * v))) not in visited
+        ]
+        if not moves:
+            break
+
+        state.apply(*rng.choice(moves))
+        visited.add(state.board)
+
+    return -state.energy
+
+
+# Generate a level: scatter the drops and the pigments, walk from there and take the end of the walk as the goal
+# The energy of the level is the energy used by the walk plus the slack, so the walk is always a solution
+def generate(drops, pigments, depth, slack=0, rng=random, topology=BOARD):
+    state = State(topology=topology)
+
+    # An empty walk (no legal moves) would give a level that is already solved, try another board
+    for _ in range(100):
+        scatter(state, drops, pigments, rng)
+        used = walk(state, depth, rng)
+        if state.board != state.initial_board:
+            break
+    else:
+        raise ValueError(f"No legal moves with {drops} drops and {pigments} pigments")
+
+    state.goal_board = state.board
+    state.goal_masks = color_masks(state.goal_board, state.n)
+    state.initial_energy = used + slack
+    state.reset()
+
+    return state
+
+
+# Entry point of the level generator
+def main(argv=None):
+    args = parse_args(argv)
+    rng = random.Random(args.seed)
+
+    topology = BOARD
+    if args.graph is not None:
+        topology = Graph.load(args.graph)
+    elif args.hex is not None:
+        topology = hex_grid(*args.hex)
+
+    for i in range(1, args.count + 1):
+        state = generate(args.drops, args.pigments, args.depth, args.slack, rng, topology)
+        state.save_level(f"{args.output}/{i}")
+        print(f"{args.output}/{i}: energy {state.initial_energy}")
+
+
+if __name__ == "__main__":
+    main()
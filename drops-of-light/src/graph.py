@@ -0,0 +1,297 @@
+import hashlib
+import os
+import pickle
+from array import array
+from collections import deque
+from math import cos, sin, pi
+from utils import adjacency_list
+
+# Distance between vertices that are not connected
+UNREACHABLE = 10**9
+
+# Largest number of automorphisms looked for in a graph
+AUTOMORPHISM_LIMIT = 1024
+
+# Graphs already built, by key, so that every state and level on the same graph shares
+# its adjacency, distances and memoized matchings instead of computing them again
+GRAPHS = {}
+
+
+# Define the board graph of a level
+# The adjacency is stored in compressed sparse row form: the neighbours of u are
+# targets[offsets[u]:offsets[u + 1]], and as one bitmask per vertex for constant time edge checks
+# Bitmasks are Python integers, so they are as wide as the graph needs
+# Use shared() to build graphs, it returns the graph already built for the same adjacency and positions
+class Graph:
+    # Initialize the graph from a list of neighbours per vertex, with optional screen positions
+    # Positions are (x, y) pairs in any unit, the GUI scales them to fit the screen
+    # The distances are computed on first use, or read from the cache file if it has them
+    def __init__(self, adjacency, positions=None, cache=None):
+        self.n = len(adjacency)
+
+        for u, neighbours in enumerate(adjacency):
+            for v in neighbours:
+                if not 0 <= v < self.n or v == u:
+                    raise ValueError(f"Invalid edge {u}-{v}")
+                if u not in adjacency[v]:
+                    raise ValueError(f"Edge {u}-{v} is not in both directions")
+
+        self.offsets = array("l", [0])
+        self.targets = array("l")
+        for neighbours in adjacency:
+            self.targets.extend(sorted(neighbours))
+            self.offsets.append(len(self.targets))
+
+        self.masks = [sum(1 << v for v in neighbours) for neighbours in adjacency]
+        self.positions = positions if positions is not None else circle_layout(self.n)
+        self.key = graph_key(adjacency, positions)
+        self.cache = cache
+        self._apsp = None
+        self._automorphisms = None
+
+        # Minimum sum of distances between two sets of vertices, shared by all states on this graph
+        self.distances = {}
+
+    # Get the neighbours of vertex u
+    def neighbours(self, u):
+        return self.targets[self.offsets[u] : self.offsets[u + 1]]
+
+    # Iterate over the edges, each one once (u < v)
+    def edges(self):
+        for u in range(self.n):
+            for v in self.neighbours(u):
+                if u < v:
+                    yield u, v
+
+    # Breadth-first search from a source, distance to every vertex
+    def bfs(self, source):
+        distance = array("l", [UNREACHABLE]) * self.n
+        distance[source] = 0
+        queue = deque([source])
+
+        while queue:
+            u = queue.popleft()
+            for v in self.targets[self.offsets[u] : self.offsets[u + 1]]:
+                if distance[v] == UNREACHABLE:
+                    distance[v] = distance[u] + 1
+                    queue.append(v)
+
+        return distance
+
+    # All-pairs shortest paths, one breadth-first search per source: O(n * (n + m))
+    def all_pairs(self):
+        return [self.bfs(u) for u in range(self.n)]
+
+    # All-pairs shortest paths, distance from vertex u to vertex v is stored in apsp[u][v]
+    # Computed once per graph, and stored in the cache file so that later runs only read them
+    @property
+    def apsp(self):
+        if self._apsp is None:
+            self._apsp = self.read_cache()
+            if self._apsp is None:
+                self._apsp = self.all_pairs()
+                self.write_cache()
+        return self._apsp
+
+    # Permutations of the vertices that preserve the edges, the identity first, as tuples (u -> image[u])
+    # Found once per graph by backtracking (see find_automorphisms)
+    @property
+    def automorphisms(self):
+        if self._automorphisms is None:
+            self._automorphisms = self.find_automorphisms()
+        return self._automorphisms
+
+    # Find the automorphisms by mapping the vertices one at a time, in breadth-first order,
+    # so that every vertex after the first of its component has an already mapped neighbour
+    # and can only go to a neighbour of that neighbour's image
+    # Stops after AUTOMORPHISM_LIMIT automorphisms, a partial group still gives valid (if fewer) symmetries
+    def find_automorphisms(self, limit=AUTOMORPHISM_LIMIT):
+        n = self.n
+        degree = [self.offsets[u + 1] - self.offsets[u] for u in range(n)]
+
+        order = []
+        anchor = [-1] * n  # Mapped neighbour of each vertex, when it is mapped
+        seen = [False] * n
+        for source in range(n):
+            if seen[source]:
+                continue
+            seen[source] = True
+            queue = deque([source])
+            while queue:
+                u = queue.popleft()
+                order.append(u)
+                for v in self.neighbours(u):
+                    if not seen[v]:
+                        seen[v] = True
+                        anchor[v] = u
+                        queue.append(v)
+
+        image = [-1] * n
+        used = [False] * n
+        found = []
+
+        def extend(i):
+            if i == n:
+                found.append(tuple(image))
+                return
+
+            u = order[i]
+            candidates = range(n) if anchor[u] < 0 else self.neighbours(image[anchor[u]])
+
+            for x in candidates:
+                if used[x] or degree[x] != degree[u]:
+                    continue
+
+                # The edges between u and the mapped vertices must be the edges between x and their images
+                if any(
+                    (self.masks[u] >> w & 1) != (self.masks[x] >> image[w] & 1) for w in order[:i]
+                ):
+                    continue
+
+                image[u] = x
+                used[x] = True
+                extend(i + 1)
+                image[u] = -1
+                used[x] = False
+
+                if len(found) >= limit:
+                    return
+
+        extend(0)
+
+        # Put the identity first
+        identity = tuple(range(n))
+        return [identity] + [permutation for permutation in found if permutation != identity]
+
+    # Read the distances from the cache file, None if there are none for this graph
+    def read_cache(self):
+        if self.cache is None or not os.path.isfile(self.cache):
+            return None
+
+        try:
+            with open(self.cache, "rb") as f:
+                tables = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+        # The graph file may have changed since the cache was written
+        if tables.get("key") != self.key:
+            return None
+        return tables["apsp"]
+
+    # Write the distances to the cache file, if the directory can be written
+    # The file is replaced atomically, so concurrent runs never read half of it
+    def write_cache(self):
+        if self.cache is None:
+            return
+
+        temporary = f"{self.cache}.{os.getpid()}"
+        try:
+            with open(temporary, "wb") as f:
+                pickle.dump({"key": self.key, "apsp": self._apsp}, f)
+            os.replace(temporary, self.cache)
+        except OSError:
+            pass
+
+    # Read a graph from a file, one line per vertex with its neighbours
+    # A line can start with the position of the vertex, as "x y:"
+    @staticmethod
+    def load(path, cache=None):
+        adjacency = []
+        positions = []
+
+        with open(path, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+
+                position, _, neighbours = line.rpartition(":")
+                adjacency.append([int(v) for v in neighbours.split()])
+                if position:
+                    x, y = position.split()
+                    positions.append((float(x), float(y)))
+
+        if positions and len(positions) != len(adjacency):
+            raise ValueError(f"{path}: either every vertex or none has a position")
+
+        return shared(adjacency, positions or None, cache)
+
+    # Write the graph to a file, in the format read by load
+    def save(self, path):
+        with open(path, "w") as f:
+            for u in range(self.n):
+                x, y = self.positions[u]
+                f.write(f"{x:g} {y:g}: {' '.join(map(str, self.neighbours(u)))}\n")
+
+
+# Identity of a graph: a digest of its sorted adjacency and its positions
+def graph_key(adjacency, positions=None):
+    text = repr(([sorted(neighbours) for neighbours in adjacency], positions))
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+# Get the graph with this adjacency and positions, building it only the first time it is asked for
+def shared(adjacency, positions=None, cache=None):
+    key = graph_key(adjacency, positions)
+    if key not in GRAPHS:
+        GRAPHS[key] = Graph(adjacency, positions, cache)
+    elif GRAPHS[key].cache is None:
+        GRAPHS[key].cache = cache
+    return GRAPHS[key]
+
+
+# Vertices evenly spaced on a circle, for graphs without positions
+def circle_layout(n):
+    radius = max(1, n / (2 * pi))
+    return [(radius * cos(2 * pi * i / n), radius * -sin(2 * pi * i / n)) for i in range(n)]
+
+
+# Positions of the original board: a center vertex, an inner circle of 12 vertices
+# and an outer circle of 6 vertices at twice the radius
+def board_layout():
+    positions = [(0, 0)]
+
+    for i in range(12):
+        angle = 2 * pi * i / 12
+        positions.append((cos(angle), -sin(angle)))
+
+    for i in range(6):
+        angle = 2 * pi * i / 6
+        positions.append((2 * cos(angle), 2 * -sin(angle)))
+
+    return positions
+
+
+# Hexagonal grid of rows x cols vertices, each one connected to up to 6 neighbours
+def hex_grid(rows, cols):
+    adjacency = [[] for _ in range(rows * cols)]
+    positions = []
+
+    for r in range(rows):
+        for c in range(cols):
+            positions.append((c + (r % 2) / 2, r * 3**0.5 / 2))
+
+            # Odd rows are shifted half a vertex to the right
+            shift = r % 2
+            neighbours = [(r, c - 1), (r, c + 1)]
+            for dr in (-1, 1):
+                neighbours += [(r + dr, c - 1 + shift), (r + dr, c + shift)]
+
+            for rr, cc in neighbours:
+                if 0 <= rr < rows and 0 <= cc < cols:
+                    adjacency[r * cols + c].append(rr * cols + cc)
+
+    return shared(adjacency, positions)
+
+
+# Graph of a level directory: the one in its graph.txt file, or the original board
+# The distances of a graph.txt are cached in graph.pickle, next to it
+def level_graph(directory):
+    path = f"{directory}/graph.txt"
+    if not os.path.isfile(path):
+        return BOARD
+    return Graph.load(path, f"{directory}/graph.pickle")
+
+
+# The original 19 vertex board, shared by every level that does not declare its own graph
+BOARD = shared(adjacency_list, board_layout())
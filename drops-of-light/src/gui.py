@@ -1,8 +1,9 @@
 import pygame
+import threading
 from playball import Playball
 from state import State
 from solver import Solver
-from math import cos, sin, pi
+from budget import TIME
 from utils import *
 
 # Initialize pygame
@@ -19,6 +20,18 @@ BG_COLOR = (0, 0, 25)
 LINE_WIDTH = 2
 CIRCLE_RADIUS = 15
 
+# Solver method of each algorithm in the algorithm menu
+SOLVERS = {
+    "A*": "solve_astar",
+    "BFS": "solve_bfs",
+    "Bidirectional": "solve_bidirectional",
+    "IDS": "solve_ids",
+    "IDA*": "solve_idastar",
+    "Portfolio": "solve_portfolio",
+    "HDA*": "solve_hdastar",
+    "ARA*": "solve_arastar",
+}
+
 
 # Define the graphical user interface
 class GUI:
@@ -29,6 +42,9 @@ class GUI:
         self.solution = None
         self.move = 0
 
+        # Best solution found so far by an anytime search, as (moves, energy left, weight)
+        self.best = None
+
         pygame.display.set_caption("Drops of Light")
         self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
 
@@ -36,7 +52,10 @@ class GUI:
         self.clock = pygame.time.Clock()
 
         self.levels = [1, 2, 3, 4]
-        self.algorithms = ["A*", "BFS", "IDS"]
+        self.algorithms = list(SOLVERS)
+
+        # Worker thread running the solver, so that the window keeps responding
+        self.thread = None
 
         self.level = 1
         self.state.set_level(self.level)
@@ -45,7 +64,7 @@ class GUI:
         self.mode = "Menu"
 
         self.positions = self.generate_positions()
-        self.playballs = [None for _ in range(19)]
+        self.playballs = [None for _ in range(self.state.n)]
 
         self.ball_selected = None
 
@@ -67,6 +86,7 @@ class GUI:
         while self.running:
             self.clock.tick(FPS)
             self.events()
+            self.update()
             self.draw()
 
     # Event detection and handling
@@ -79,6 +99,7 @@ class GUI:
             if event.type == pygame.KEYDOWN:
                 # Return to the menu when the escape key is pressed
                 if event.key == pygame.K_ESCAPE:
+                    self.cancel()
                     self.mode = "Menu"
                     self.reset()
 
@@ -102,18 +123,19 @@ class GUI:
                         if self.state.undo():
                             self.move -= 1
 
+                elif self.mode == "Solving":
+                    # Stop the solver when the c key is pressed
+                    # Anytime searches return the best solution found so far, which is shown
+                    if event.key == pygame.K_c:
+                        self.cancel()
+                        self.move = 0
+                        self.mode = "Menu" if self.solution is None else "Solution"
+
                 elif self.mode == "Solution":
                     # Move the state back when the backspace key is pressed
                     if event.key == pygame.K_BACKSPACE and self.move > 0:
                         self.move -= 1
-                        move = self.solution[self.move]
-                        energy = (
-                            self.solution[self.move - 1][4]
-                            if self.move > 0
-                            else self.state.initial_energy
-                        )
-                        self.state.reverse_move(
-                            move[1], move[2], move[3], energy)
+                        self.state.undo()
 
                     # Move the state forward when the enter key is pressed
                     if event.key == pygame.K_RETURN:
@@ -135,29 +157,17 @@ class GUI:
                     for i, algorithm in enumerate(self.algorithms):
                         if event.key == getattr(pygame, f"K_{i + 1}"):
                             self.algorithm = algorithm
-                            self.mode = "Solution"
-
-                            self.draw_loading()
-                            start = pygame.time.get_ticks()
-
-                            if algorithm == "A*":
-                                self.solution = self.solver.get_solution(
-                                    self.solver.solve_astar())
-                            elif algorithm == "BFS":
-                                self.solution = self.solver.get_solution(
-                                    self.solver.solve_bfs())
-                            elif algorithm == "IDS":
-                                self.solution = self.solver.get_solution(
-                                    self.solver.solve_ids())
-
-                            if self.solution is None:
-                                self.mode = "Menu"
-                                self.failed = True
-
-                            end = pygame.time.get_ticks()
-                            self.time = end - start
-
-                            self.move = 0
+                            self.mode = "Solving"
+
+                            self.solver.cancelled = False
+                            self.solver.progress = None
+                            self.solver.on_solution = self.improve
+                            self.solution = None
+                            self.best = None
+                            self.thread = threading.Thread(
+                                target=self.solve, args=(algorithm,), daemon=True
+                            )
+                            self.thread.start()
 
             if event.type == pygame.MOUSEBUTTONDOWN:
                 # Handle the game input
@@ -220,6 +230,41 @@ class GUI:
                             self.splitting_move = True
                             self.splitting_buffer = colors
 
+    # Solve the level with the given algorithm, runs in the worker thread
+    def solve(self, algorithm):
+        start = pygame.time.get_ticks()
+
+        solved = self.solver.solve(SOLVERS[algorithm])
+        self.solution = self.solver.get_solution(solved)
+
+        end = pygame.time.get_ticks()
+        self.time = end - start
+
+    # Keep track of the better solutions found by an anytime search, runs in the worker thread
+    def improve(self, path, weight):
+        self.best = (len(path), path[-1][4] if path else self.state.energy, weight)
+
+    # Stop the worker thread, if there is one, and wait for it to finish
+    def cancel(self):
+        if self.thread is not None:
+            self.solver.cancelled = True
+            self.thread.join()
+            self.thread = None
+
+    # Show the solution once the worker thread is done
+    def update(self):
+        if self.mode != "Solving" or self.thread.is_alive():
+            return
+
+        self.thread = None
+        self.move = 0
+
+        if self.solution is None:
+            self.mode = "Menu"
+            self.failed = True
+        else:
+            self.mode = "Solution"
+
     # Draw the screen
     def draw(self):
         if self.mode == "Menu":
@@ -230,6 +275,8 @@ class GUI:
             self.draw_algorithm_select()
         elif self.mode == "Game":
             self.draw_game()
+        elif self.mode == "Solving":
+            self.draw_loading()
         elif self.mode == "Solution":
             self.draw_solution()
 
@@ -251,8 +298,9 @@ class GUI:
                         (WIDTH // 2 + 100, HEIGHT // 2 + 150))
 
         if self.failed:
+            reason = self.solver.result.reason if self.solver.result else None
             self.write_text(
-                "Time Limit Exceeded", 28, (
+                "Time Limit Exceeded" if reason == TIME else "No Solution Found", 28, (
                     WIDTH // 2 + 100, HEIGHT // 2 + 200), (128, 0, 0)
             )
 
@@ -299,7 +347,7 @@ class GUI:
 
         pygame.display.flip()
 
-    # Draw the loading screen
+    # Draw the loading screen, with the progress of the search
     def draw_loading(self):
         self.screen.fill(BG_COLOR)
         self.write_text(
@@ -310,6 +358,30 @@ class GUI:
             "This may take a while", 36, (WIDTH // 2 - 170, HEIGHT // 2 + 50)
         )
 
+        progress = self.solver.progress
+        if progress is not None:
+            bound = progress["bound"]
+            self.write_text(
+                f"Expanded: {progress['expanded']}    Frontier: {progress['frontier']}"
+                + (f"    Bound: {bound:g}" if bound is not None else "")
+                + f"    Elapsed: {progress['elapsed']:.1f}s",
+                20,
+                (WIDTH // 2 - 250, HEIGHT // 2 + 125),
+            )
+
+        if self.best is not None:
+            moves, energy, weight = self.best
+            self.write_text(
+                f"Best so far: {moves} moves, {energy} energy left (weight {weight:g})",
+                20,
+                (WIDTH // 2 - 200, HEIGHT // 2 + 150),
+                (0, 255, 0),
+            )
+
+        self.write_text(
+            "c: cancel", 20, (WIDTH // 2 - 40, HEIGHT // 2 + 175), (128, 128, 128)
+        )
+
         pygame.display.flip()
 
     # Draw the game
@@ -327,7 +399,7 @@ class GUI:
             f"{self.state.energy}", 28, (750, HEIGHT // 2 + 150), (255, 255, 0)
         )
 
-        if self.algorithm == "A*":
+        if self.algorithm in ("A*", "IDA*", "HDA*", "ARA*"):
             self.write_text("Evaluation:", 28, (600, HEIGHT // 2 + 200))
             self.write_text(
                 f"{self.state.eval()}", 28, (750, HEIGHT // 2 + 200), (0, 255, 0)
@@ -338,8 +410,9 @@ class GUI:
             f"Algorithm: {self.algorithm}", 24, (WIDTH //
                                                  2 + 275, 100), (255, 0, 255)
         )
+        cached = " (cached)" if self.solver.result.cached else ""
         self.write_text(
-            f"Took {self.time / 1000:.2f} seconds", 20, (WIDTH // 2 + 275, 150)
+            f"Took {self.time / 1000:.2f} seconds{cached}", 20, (WIDTH // 2 + 275, 150)
         )
 
         for i, move in enumerate(self.solution[max(0, self.move - 15): self.move]):
@@ -349,6 +422,12 @@ class GUI:
                 (WIDTH // 2 + 275, 200 + 25 * i),
             )
 
+        # Draw the statistics of the search
+        if self.solver.stats is not None:
+            for i, line in enumerate(self.solver.stats.lines()):
+                self.write_text(
+                    line, 16, (20, HEIGHT - 90 + 20 * i), (128, 128, 128))
+
         pygame.display.flip()
 
     # Draw the game
@@ -424,28 +503,23 @@ class GUI:
 
     # Takes an offset and scale as parameters to allow for multiple graphs
     # to be drawn on the same screen (i.e. the current and goal states)
+    # The positions of the graph are centered and scaled to fit in a circle of radius 240 * scale
     def generate_positions(self, offset=(0, 0), scale=1):
-        positions = []
-
-        radius = 120 * scale
+        layout = self.state.topology.positions
 
-        # Center of the graph
-        center = (offset[0], offset[1])
-        positions.append(center)
+        xs = [x for x, _ in layout]
+        ys = [y for _, y in layout]
+        cx = (min(xs) + max(xs)) / 2
+        cy = (min(ys) + max(ys)) / 2
+        extent = max(((x - cx) ** 2 + (y - cy) ** 2) ** 0.5 for x, y in layout) or 1
 
-        # The inner circle has 12 vertices
-        for i in range(12):
-            angle = 2 * pi * i / 12
-            x = center[0] + radius * cos(angle)
-            y = center[1] + radius * -sin(angle)
-            positions.append((int(x), int(y)))
+        radius = 240 * scale / extent
 
-        # The outer circle has 6 vertices
-        for i in range(6):
-            angle = 2 * pi * i / 6
-            x = center[0] + 2 * radius * cos(angle)
-            y = center[1] + 2 * radius * -sin(angle)
-            positions.append((int(x), int(y)))
+        positions = []
+        for x, y in layout:
+            positions.append(
+                (int(offset[0] + radius * (x - cx)), int(offset[1] + radius * (y - cy)))
+            )
 
         return positions
 
@@ -459,22 +533,24 @@ class GUI:
 
     # Draw the playable graph
     def draw_playable_graph(self):
-        for i in range(19):
-            for j in adjacency_list[i]:
-                pygame.draw.line(
-                    self.screen,
-                    (128, 128, 128),
-                    self.positions[i],
-                    self.positions[j],
-                    int(LINE_WIDTH),
-                )
+        # The state stores a packed board, unpack it once per frame
+        graph = self.state.graph
+
+        for i, j in self.state.topology.edges():
+            pygame.draw.line(
+                self.screen,
+                (128, 128, 128),
+                self.positions[i],
+                self.positions[j],
+                int(LINE_WIDTH),
+            )
 
         for i, playball in enumerate(self.playballs):
             if i != self.ball_selected:
-                color = rgb[get_color(self.state.graph[i])]
+                color = rgb[get_color(graph[i])]
                 r, g, b = color
 
-                for c in self.state.graph[i]:
+                for c in graph[i]:
                     if c < 0:
                         color = (r // 2, g // 2, b // 2)
                         break
@@ -482,7 +558,7 @@ class GUI:
                 playball.draw(color)
 
             else:
-                negatives = list(filter(lambda x: x < 0, self.state.graph[i]))
+                negatives = list(filter(lambda x: x < 0, graph[i]))
                 inverted = list(map(lambda x: -x, negatives))
                 color = rgb[get_color(inverted)]
                 r, g, b = color
@@ -497,15 +573,14 @@ class GUI:
     def draw_graph(self, graph, offset=(0, 0), scale=1, vertex=False):
         positions = self.generate_positions(offset, scale)
 
-        for i in range(19):
-            for j in adjacency_list[i]:
-                pygame.draw.line(
-                    self.screen,
-                    (128, 128, 128),
-                    positions[i],
-                    positions[j],
-                    int(LINE_WIDTH * scale),
-                )
+        for i, j in self.state.topology.edges():
+            pygame.draw.line(
+                self.screen,
+                (128, 128, 128),
+                positions[i],
+                positions[j],
+                int(LINE_WIDTH * scale),
+            )
 
         for i, pos in enumerate(positions):
             pygame.draw.circle(self.screen, (192, 192, 192),
@@ -552,11 +627,11 @@ class GUI:
     def reset(self):
         self.state = State()
         self.state.set_level(self.level)
-        self.solver = Solver(self.state)
+        self.solver = Solver(self.state, cache=self.solver.cache)
         self.solution = None
         self.move = 0
         self.positions = self.generate_positions()
-        self.playballs = [None for _ in range(19)]
+        self.playballs = [None for _ in range(self.state.n)]
         self.ball_selected = None
         self.splitting_move = False
         self.splitting_buffer = []
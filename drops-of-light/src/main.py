@@ -1,3 +1,4 @@
+from cache import SolutionCache
 from state import State
 from solver import Solver
 from gui import GUI
@@ -5,7 +6,7 @@ from gui import GUI
 
 def main():
     state = State()
-    solver = Solver(state)
+    solver = Solver(state, cache=SolutionCache())
     gui = GUI(state, solver)
 
     gui.run()
@@ -0,0 +1,162 @@
+import os
+import pickle
+from array import array
+from collections import deque
+from math import comb
+from cache import digest
+from graph import UNREACHABLE
+from utils import BITS, bits
+
+# Largest number of projected states of a pattern database, larger projections are not built
+PATTERN_LIMIT = 200000
+
+# Distance stored for projected states that cannot reach the goal
+UNSOLVABLE = 255
+
+
+# Define the pattern database of one primary color
+# The projection of a board only keeps the vertices holding that color: every move of the game
+# moves a drop of it to a neighbouring vertex without a drop or a pigment of the same color (or leaves it alone),
+# so the number of projected moves to the goal projection is a lower bound on the moves of the game
+# Distances come from a breadth-first search backward from the goal projection, and are stored in a byte array
+# indexed by the combinatorial rank of the set of vertices
+class PatternDatabase:
+    # Initialize the database of a color for a graph, the pigments and the goal board
+    def __init__(self, topology, color, pigments, goal_board):
+        self.topology = topology
+        self.color = color
+
+        # Vertices a drop of the color can stand on, numbered for the ranking
+        bit = 1 << (color - 1)
+        self.free = [u for u in range(topology.n) if not (pigments >> (BITS * u)) & bit]
+        self.position = [-1] * topology.n
+        for i, u in enumerate(self.free):
+            self.position[u] = i
+
+        self.goal = sum(1 << u for u in range(topology.n) if (goal_board >> (BITS * u)) & bit)
+        self.k = self.goal.bit_count()
+        self.size = comb(len(self.free), self.k)
+
+        # binomial[p][i] is the weight of a drop on free vertex p when it is the i-th one (from 1)
+        self.binomial = [[comb(p, i) for i in range(self.k + 1)] for p in range(len(self.free))]
+        self.table = None
+
+    # Rank of a set of vertices among the sets of the same size (combinatorial number system)
+    def rank(self, mask):
+        rank = 0
+        i = 0
+        for u in bits(mask):
+            i += 1
+            rank += self.binomial[self.position[u]][i]
+        return rank
+
+    # Fill the table with a breadth-first search from the goal projection
+    # Projected moves can be reversed, so the distance from the goal is the distance to it
+    def build(self):
+        table = array("B", [UNSOLVABLE]) * self.size
+        table[self.rank(self.goal)] = 0
+        queue = deque([self.goal])
+        offsets, targets = self.topology.offsets, self.topology.targets
+        position = self.position
+
+        while queue:
+            mask = queue.popleft()
+            distance = min(table[self.rank(mask)] + 1, UNSOLVABLE - 1)
+
+            for u in bits(mask):
+                for v in targets[offsets[u] : offsets[u + 1]]:
+                    if position[v] < 0 or mask >> v & 1:
+                        continue
+
+                    successor = mask ^ (1 << u) ^ (1 << v)
+                    rank = self.rank(successor)
+                    if table[rank] == UNSOLVABLE:
+                        table[rank] = distance
+                        queue.append(successor)
+
+        self.table = table
+
+    # Lower bound on the moves that bring the drops of the color in mask to the goal
+    def lookup(self, mask):
+        return self.table[self.rank(mask)]
+
+
+# Define the pattern databases of a level, one per primary color
+# They are combined by taking the largest estimate: a single move can move drops of several colors,
+# so their sum would not be a lower bound
+# Colors whose projection has more than PATTERN_LIMIT states have no database
+# The tables are built on first use, and stored in a cache file so that later runs only read them
+class PatternHeuristic:
+    # Initialize the databases of a state's graph, pigments and goal
+    def __init__(self, state, cache=None):
+        self.databases = []
+        for color in (1, 2, 3):
+            database = PatternDatabase(state.topology, color, state.pigments, state.goal_board)
+            if 0 < database.k and database.size <= PATTERN_LIMIT:
+                self.databases.append(database)
+
+        self.key = digest(state.topology.key, state.pigments, state.goal_board, PATTERN_LIMIT)
+        self.cache = cache
+        self.ready = False
+
+    # Read the tables from the cache file, or build them and write it
+    def prepare(self):
+        tables = self.read_cache()
+
+        if tables is not None and len(tables) == len(self.databases):
+            for database, table in zip(self.databases, tables):
+                database.table = table
+        else:
+            for database in self.databases:
+                database.build()
+            self.write_cache()
+
+        self.ready = True
+
+    # Read the tables from the cache file, None if there are none for this level
+    def read_cache(self):
+        if self.cache is None or not os.path.isfile(self.cache):
+            return None
+
+        try:
+            with open(self.cache, "rb") as f:
+                tables = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+        # The level may have changed since the cache was written
+        if tables.get("key") != self.key:
+            return None
+        return tables["tables"]
+
+    # Write the tables to the cache file, if the directory can be written
+    def write_cache(self):
+        if self.cache is None:
+            return
+
+        temporary = f"{self.cache}.{os.getpid()}"
+        try:
+            with open(temporary, "wb") as f:
+                pickle.dump({"key": self.key, "tables": [db.table for db in self.databases]}, f)
+            os.replace(temporary, self.cache)
+        except OSError:
+            pass
+
+    # Lower bound on the moves to the goal from the per-color vertex masks of a board
+    # Boards with a projection that cannot reach the goal cannot reach it either, their estimate is UNREACHABLE,
+    # as well as boards with a different number of drops of a color than the goal (they cannot be ranked)
+    def estimate(self, masks):
+        if not self.ready:
+            self.prepare()
+
+        h = 0
+        for database in self.databases:
+            mask = masks[database.color - 1]
+            if mask.bit_count() != database.k:
+                return UNREACHABLE
+
+            distance = database.lookup(mask)
+            if distance == UNSOLVABLE:
+                return UNREACHABLE
+            h = max(h, distance)
+        return h
@@ -1,34 +1,327 @@
 import heapq as pq
-import time
+import multiprocessing as mp
+from budget import *
+from buckets import BucketQueue
+from cache import digest
+from collections import deque
+from queue import Empty
 from state import State
+from stats import SearchStats, perf_counter
+from store import ParentStore
 from utils import *
 
+# Algorithms raced by the portfolio solver, as (method, heuristic weight)
+# The weight only matters for the informed searches
+PORTFOLIO = [
+    ("solve_astar", 5),
+    ("solve_astar", 2),
+    ("solve_astar", 1),
+    ("solve_idastar", 5),
+    ("solve_bfs", 5),
+    ("solve_ids", 5),
+]
+
+# Factor applied to the heuristic weight after each pass of the anytime search (ARA*)
+ARA_DECAY = 0.5
+
+
+# Heuristic weights of the passes of the anytime search, from the given weight down to 1
+def weight_schedule(weight, decay=ARA_DECAY):
+    weights = [weight]
+    while weights[-1] > 1:
+        weights.append(max(1, weights[-1] * decay))
+    return weights
+
+
+# Run a single algorithm of the portfolio, in a worker process
+# Returns the algorithm, the moves of its solution (None if it failed) and its statistics
+def solve_worker(args):
+    problem, budget, method, weight = args
+    State.weight = weight
+
+    solver = Solver(problem, budget)
+    path = solver.get_solution(getattr(solver, method)())
+
+    if path is None:
+        return method, weight, None, solver.stats
+
+    moves = [(u, v, pack_colors(colors)) for _, u, v, colors, _ in path]
+    return method, weight, moves, solver.stats
+
+
+# Worker of the hash-distributed A* (HDA*) search that owns a state key
+# The hash of an integer is the integer itself, whose low bits only hold the colors of vertex 0,
+# so the key is folded into 64 bits and mixed by a multiplicative (Fibonacci) hash before the modulo
+def hda_owner(key, workers):
+    mixed = 0
+    while key:
+        mixed ^= key & 0xFFFFFFFFFFFFFFFF
+        key >>= 64
+    return ((mixed * 0x9E3779B97F4A7C15 & 0xFFFFFFFFFFFFFFFF) >> 32) % workers
+
+
+# Worker of the hash-distributed A* (HDA*) search
+# Each worker owns the states whose key hashes to its index: it keeps their open and closed lists
+# and sends the successors owned by other workers to their inboxes, in batches
+# Nodes are (eval, heuristic, board, color masks, energy, last vertex moved from, moves from the problem)
+# They are ordered by the weighted evaluation, but only pruned against the incumbent solution when
+# their unweighted g + h cannot improve it, so that the search still ends with an optimal solution
+# The heuristic weight is passed in, since spawned workers do not inherit the class attribute
+def hda_worker(
+    index,
+    problem,
+    inboxes,
+    results,
+    sent,
+    received,
+    idle,
+    expansions,
+    incumbent,
+    stop,
+    batch,
+    weight,
+):
+    State.weight = weight
+    workers = len(inboxes)
+    inbox = inboxes[index]
+    state = problem.deepcopy()
+    queue = []
+    closed = {}
+    outbox = [[] for _ in range(workers)]
+    counter = 0
+    expanded = 0
+
+    # Add nodes to the open list, unless they were already reached with at most the same cost
+    # Costs are kept by state key, so symmetric boards count as the same state
+    def push(nodes):
+        nonlocal counter
+        for eval, h, board, masks, energy, last, path in nodes:
+            g = state.initial_energy - energy
+            key = state.canonical(board)
+            if closed.get(key, 1e9) <= g:
+                continue
+
+            closed[key] = g
+            counter -= 1  # Newer nodes first among equal evaluations
+            pq.heappush(queue, (eval, counter, (h, board, masks, energy, last, path)))
+
+    # Send the buffered nodes to their owners
+    def flush():
+        for owner, nodes in enumerate(outbox):
+            if nodes:
+                sent[index] += 1
+                inboxes[owner].put(nodes)
+                outbox[owner] = []
+
+    while not stop.is_set():
+        # Receive the nodes sent by the other workers, waiting for them when idle
+        try:
+            while True:
+                nodes = inbox.get(block=not queue, timeout=0.01)
+                idle[index] = 0
+                received[index] += 1
+                push(nodes)
+        except Empty:
+            pass
+
+        if not queue:
+            expansions[index] = expanded
+            flush()
+            idle[index] = 1
+            continue
+
+        _, _, (h, board, masks, energy, last, path) = pq.heappop(queue)
+        g = state.initial_energy - energy
+
+        # Skip nodes reached again with a better cost, or that cannot improve the incumbent
+        if closed[state.canonical(board)] < g or g + h >= incumbent.value:
+            continue
+
+        if board == state.goal_board:
+            with incumbent.get_lock():
+                if g < incumbent.value:
+                    incumbent.value = g
+                    results.put((g, path))
+            continue
+
+        state.load(board, masks, energy, last)
+
+        for u, v, mask in state.gen_moves():
+            state.apply(u, v, mask)
+
+            if not state.dead():
+                h = state.heuristic()
+
+                if state.initial_energy - state.energy + h < incumbent.value:
+                    node = (
+                        state.eval(),
+                        h,
+                        state.board,
+                        state.masks,
+                        state.energy,
+                        u,
+                        path + ((u, v, mask),),
+                    )
+                    owner = hda_owner(state.key(), workers)
+
+                    if owner == index:
+                        push([node])
+                    else:
+                        outbox[owner].append(node)
+
+            state.undo()
+
+        expanded += 1
+        if expanded % batch == 0:
+            expansions[index] = expanded
+            flush()
+
+    expansions[index] = expanded
+
+    # Nodes left in the inboxes are no longer needed, do not wait for them to be delivered
+    for queue in inboxes:
+        queue.cancel_join_thread()
+
 
 # Define the solver for the game
 class Solver:
-    # Initialize the solver with the given problem
-    def __init__(self, problem: State):
+    # Initialize the solver with the given problem and search budget (15 seconds by default)
+    # If profile is set, searches are also profiled with cProfile (see SearchStats)
+    def __init__(self, problem: State, budget: Budget = None, profile=False, cache=None):
         self.problem = problem
-        self.solution = {}
+        self.solution = ParentStore(problem.n)
+        self.budget = budget or Budget()
+        self.profile = profile
+        self.cache = cache
+        self.result = None
+        self.stats = None
+
+        # Snapshot of the running search and flag to stop it, shared with the GUI thread
+        self.progress = None
+        self.cancelled = False
+
+        # Called with the path and the weight of each better solution found by the anytime search
+        self.on_solution = None
+
+        # Algorithm and weight that produced the solution of the portfolio solver
+        self.winner = None
+
+    # Start a new search, the parent store only holds the states of this search
+    def begin(self):
+        self.solution = ParentStore(self.problem.n)
+        self.result = SearchResult()
+        self.stats = SearchStats(self.profile)
+        self.result.stats = self.stats
+        self.progress = None
+        self.budget.begin()
+        self.stats.begin()
+
+    # Tell if the running search can go on, called once per expansion
+    # The budget is only checked every budget.every expansions
+    def check(self, expanded, frontier, bound, state):
+        if expanded % self.budget.every:
+            return True
+
+        return self.poll(expanded, frontier, bound, state)
+
+    # Publish the progress of the running search, keeping the given state if it is the best so far,
+    # and tell if it can go on: searches stop when the budget is exceeded or once cancelled from another thread
+    # If nodes is not set, the node limit is not checked against expanded (the searches check it themselves)
+    def poll(self, expanded, frontier, bound, state, nodes=True):
+        result = self.result
+        result.expanded = expanded
+        result.bound = bound
+        result.elapsed = self.budget.elapsed()
+
+        if state is not None:
+            result.offer(state)
+
+        self.progress = {
+            "expanded": expanded,
+            "frontier": frontier,
+            "bound": bound,
+            "elapsed": result.elapsed,
+        }
+
+        result.reason = CANCELLED if self.cancelled else self.budget.exceeded(expanded, nodes)
+        return result.reason is None
+
+    # Record the outcome of the running search and return its solution (None if not solved)
+    def finish(self, solved, expanded):
+        self.stats.end(expanded)
+
+        result = self.result
+        result.expanded = expanded
+        result.elapsed = self.budget.elapsed()
+
+        if solved is not None:
+            result.state = solved
+            result.solved = True
+            result.h = 0
+
+        if result.reason is None:
+            result.reason = SOLVED if solved is not None else EXHAUSTED
+
+        return solved
+
+    # Key of the problem solved with a method in the solution cache
+    # It covers everything the solution depends on: the boards, the energy, the vertex of the previous move
+    # (which can make a split free), the graph and the heuristic weight
+    def cache_key(self, method):
+        problem = self.problem
+        return digest(
+            problem.board,
+            problem.pigments,
+            problem.goal_board,
+            problem.energy,
+            problem.last_move[0],
+            problem.topology.key,
+            method,
+            State.weight,
+        )
+
+    # Solve the game with the solve_<name> method given, looking the solution up in the cache first
+    # Solutions of searches that ran to completion are stored in the cache, the others are not
+    # since a larger budget may succeed (or, for the anytime search, find a better solution)
+    def solve(self, method):
+        if self.cache is None:
+            return getattr(self, method)()
+
+        key = self.cache_key(method)
+        moves = self.cache.get(key)
+
+        if moves is not None:
+            self.begin()
+            self.result.cached = True
+            return self.finish(self.adopt(moves), 0)
+
+        solved = getattr(self, method)()
+        if solved is not None and self.result.reason == SOLVED:
+            path = self.get_solution(solved)
+            self.cache.put(key, [(u, v, pack_colors(colors)) for _, u, v, colors, _ in path])
+
+        return solved
 
     # Solve the game using A* algorithm
+    # The open list is a bucket queue by evaluation, newest states first among equal evaluations
     def solve_astar(self):
-        start = time.time()
+        self.begin()
 
-        visited = set({self.problem.hash()})
-        self.solution[self.problem.hash()] = (-1, -1)
-        queue = [(self.problem.eval(), self.problem)]
-        pq.heapify(queue)
+        reached = self.solution
+        reached.add(self.problem.key())
+        queue = BucketQueue()
+        queue.push(self.problem.eval(), self.problem)
         best = 1e9
         solution = None
+        expanded = 0
+        stats = self.stats
 
         while queue:
-            now = time.time()
-
-            if now - start > 15:
-                break  # Time limit exceeded
+            if not self.check(expanded, len(queue), *queue.peek()):
+                break  # Budget exceeded or cancelled
 
-            eval, current = pq.heappop(queue)
+            eval, current = queue.pop()
+            expanded += 1
 
             if eval > best:
                 break
@@ -38,128 +331,688 @@ class Solver:
                 solution = current
                 continue
 
+            parent = reached.index[current.key()]
+            start = perf_counter()
             next_moves = current.gen_moves()
+            stats.gen_time += perf_counter() - start
 
-            for u, v, colors in next_moves:
-                new_state = current.deepcopy()
-                new_state.move(u, v, colors)
-                hash = new_state.hash()
-                new_eval = new_state.eval()
+            for u, v, mask in next_moves:
+                # Try the move in place and only copy the state if it is kept
+                current.apply(u, v, mask)
+                key = current.key()
+                stats.generated += 1
 
-                if hash in visited or new_state.energy < 0:
+                if key in reached:
+                    stats.duplicates += 1
+                    current.undo()
                     continue
 
+                if current.dead():
+                    stats.energy_pruned += 1
+                    current.undo()
+                    continue
+
+                start = perf_counter()
+                new_eval = current.eval()
+                stats.eval_time += perf_counter() - start
+
                 if new_eval > best:  # Or new_state.min_distance > new_state.energy:
+                    stats.bound_pruned += 1
+                    current.undo()
                     continue
 
-                pq.heappush(queue, (new_eval, new_state))
-                visited.add(hash)
-                self.solution[hash] = (current.hash(), u, v, colors, new_state.energy)
+                start = perf_counter()
+                new_state = current.deepcopy()
+                stats.copy_time += perf_counter() - start
+                current.undo()
+
+                queue.push(new_eval, new_state)
+                reached.add(key, parent, u, v, mask)
+
+                if len(queue) > stats.peak_frontier:
+                    stats.peak_frontier = len(queue)
+
+        return self.finish(solution, expanded)
+
+    # Solve the game using anytime repairing A* (ARA*)
+    # The first pass uses a high heuristic weight to find a solution fast, and every following pass
+    # lowers the weight (see weight_schedule) and improves the solution, reusing the g values found so far:
+    # states whose g improves after being expanded in a pass wait in an inconsistent list for the next one
+    # Each better solution is passed to self.on_solution, and when the budget runs out
+    # the best solution so far is returned (the result reason tells that the search was cut short)
+    def solve_arastar(self, weights=None):
+        self.begin()
+        weights = weights or weight_schedule(State.weight)
+
+        state = self.problem.deepcopy()
+        reached = self.solution
+        reached.add(state.key())
+
+        if state.is_goal():
+            return self.finish(self.adopt([]), 0)
+
+        # Lowest cost (energy used) found for each state, and the best solution
+        costs = {state.key(): 0}
+        best = 1e9
+        solution = None
+        expanded = 0
+        stats = self.stats
+
+        # Nodes are (g, h, search node), the priority g + weight * h is recomputed for every pass
+        nodes = [(0, state.heuristic(), state.node())]
+
+        for weight in weights:
+            queue = BucketQueue()
+            for g, h, node in nodes:
+                if g + h < best:
+                    queue.push(g + weight * h, (g, h, node))
 
-        return solution
+            closed = set()
+            inconsistent = {}
+
+            # A pass ends when no node in the open list can lead to a better solution at this weight
+            while queue and queue.peek()[0] < best:
+                if not self.check(expanded, len(queue), weight, state):
+                    return self.finish(solution, expanded)  # Budget exceeded or cancelled
+
+                _, (g, _, node) = queue.pop()
+                state.load(*node)
+                parent_key = state.key()
+
+                # Skip nodes that were reached again with a lower cost, or already expanded in this pass
+                if g > costs[parent_key] or parent_key in closed:
+                    stats.duplicates += 1
+                    continue
+
+                closed.add(parent_key)
+                parent = reached.index[parent_key]
+                expanded += 1
+
+                start = perf_counter()
+                next_moves = state.gen_moves()
+                stats.gen_time += perf_counter() - start
+
+                for u, v, mask in next_moves:
+                    state.apply(u, v, mask)
+                    key = state.key()
+                    stats.generated += 1
+
+                    new_g = state.initial_energy - state.energy
+                    if new_g >= costs.get(key, 1e9):
+                        stats.duplicates += 1
+                    elif state.dead():
+                        stats.energy_pruned += 1
+                    else:
+                        costs[key] = new_g
+                        reached.add(key, parent, u, v, mask)
+
+                        start = perf_counter()
+                        h = state.heuristic()
+                        stats.eval_time += perf_counter() - start
+
+                        if state.is_goal():
+                            best = new_g
+                            solution = state.deepcopy()
+                            if self.on_solution is not None:
+                                self.on_solution(self.get_solution(solution), weight)
+                        elif new_g + h >= best:
+                            stats.bound_pruned += 1
+                        elif key in closed:
+                            inconsistent[key] = (new_g, h, state.node())
+                        else:
+                            queue.push(new_g + weight * h, (new_g, h, state.node()))
+
+                    state.undo()
+
+                if len(queue) > stats.peak_frontier:
+                    stats.peak_frontier = len(queue)
+
+            # The next pass starts from the open list and the states improved after their expansion
+            nodes = [node for _, node in queue.items()] + list(inconsistent.values())
+
+        return self.finish(solution, expanded)
 
     # Solve the game using BFS algorithm
+    # The queue holds compact search nodes, expanded in place on a single working state
     def solve_bfs(self):
-        start = time.time()
+        self.begin()
 
-        visited = set({self.problem.hash()})
-        self.solution[self.problem.hash()] = (-1, -1)
-        queue = [self.problem]
+        reached = self.solution
+        reached.add(self.problem.key())
+        state = self.problem.deepcopy()
+        queue = deque([state.node()])
+        expanded = 0
+        stats = self.stats
 
         while queue:
-            now = time.time()
-
-            if now - start > 15:
+            if not self.check(expanded, len(queue), None, state):
                 break
 
-            current = queue.pop(0)
+            state.load(*queue.popleft())
+            expanded += 1
 
-            if current.is_goal():
-                return current
+            if state.is_goal():
+                return self.finish(state, expanded)
 
-            next_moves = current.gen_moves()
+            parent = reached.index[state.key()]
+            start = perf_counter()
+            next_moves = state.gen_moves()
+            stats.gen_time += perf_counter() - start
 
-            for u, v, colors in next_moves:
-                new_state = current.deepcopy()
-                new_state.move(u, v, colors)
-                hash = new_state.hash()
+            for u, v, mask in next_moves:
+                state.apply(u, v, mask)
+                key = state.key()
+                stats.generated += 1
 
-                if hash in visited or new_state.energy < 0:
-                    continue
+                if key in reached:
+                    stats.duplicates += 1
+                elif state.dead():
+                    stats.energy_pruned += 1
+                else:
+                    queue.append(state.node())
+                    reached.add(key, parent, u, v, mask)
+
+                state.undo()
+
+            if len(queue) > stats.peak_frontier:
+                stats.peak_frontier = len(queue)
+
+        return self.finish(None, expanded)
+
+    # Solve the game using bidirectional BFS
+    # One search expands forward from the problem and the other backward from the goal, with reverse moves,
+    # always growing the smaller of the two frontiers by a whole layer
+    # The backward search cannot track energy, so when both meet the joined path is replayed
+    # and only accepted if it ends with energy left
+    def solve_bidirectional(self):
+        self.begin()
 
-                queue.append(new_state)
-                visited.add(hash)
-                self.solution[hash] = (current.hash(), u, v, colors, new_state.energy)
+        state = self.problem.deepcopy()
+        root = state.key()
+        goal = state.goal_board
 
-        return None
+        # Parents of the states reached from the problem, and successors of the ones reached from the goal
+        forward = {root: None}
+        backward = {goal: None}
+        forward_layer = [state.node()]
+        backward_layer = [(goal, state.goal_masks)]
+        expanded = 0
+        stats = self.stats
+
+        if root == goal:
+            return self.finish(self.adopt([]), expanded)
+
+        while forward_layer and backward_layer:
+            if len(forward_layer) <= len(backward_layer):
+                layer = []
+
+                for node in forward_layer:
+                    if not self.check(expanded, len(forward_layer) + len(backward_layer), None, state):
+                        return self.finish(None, expanded)
+
+                    state.load(*node)
+                    parent = state.key()
+                    expanded += 1
+
+                    start = perf_counter()
+                    next_moves = state.gen_moves()
+                    stats.gen_time += perf_counter() - start
+
+                    for u, v, mask in next_moves:
+                        state.apply(u, v, mask)
+                        key = state.key()
+                        stats.generated += 1
+
+                        if key in forward:
+                            stats.duplicates += 1
+                        elif state.dead():
+                            stats.energy_pruned += 1
+                        else:
+                            forward[key] = (parent, u, v, mask)
+                            layer.append(state.node())
+
+                            if key in backward:
+                                solved = self.join(key, forward, backward)
+                                if solved is not None:
+                                    return self.finish(solved, expanded)
+
+                        state.undo()
+
+                forward_layer = layer
+                stats.peak_frontier = max(stats.peak_frontier, len(forward_layer) + len(backward_layer))
+            else:
+                layer = []
+
+                # Backward states are not reachable from the problem, so none is offered as a partial result
+                for board, masks in backward_layer:
+                    if not self.check(expanded, len(forward_layer) + len(backward_layer), None, None):
+                        return self.finish(None, expanded)
+
+                    state.load(board, masks, 0, None)
+                    expanded += 1
+
+                    start = perf_counter()
+                    next_moves = state.gen_reverse_moves()
+                    stats.gen_time += perf_counter() - start
+
+                    for u, v, mask in next_moves:
+                        state.flip(u, v, mask)
+                        key = state.key()
+                        stats.generated += 1
+
+                        if key in backward:
+                            stats.duplicates += 1
+                        else:
+                            backward[key] = (u, v, mask, board)
+                            layer.append((state.board, state.masks))
+
+                            if key in forward:
+                                solved = self.join(key, forward, backward)
+                                if solved is not None:
+                                    return self.finish(solved, expanded)
+
+                        state.flip(u, v, mask)
+
+                backward_layer = layer
+                stats.peak_frontier = max(stats.peak_frontier, len(forward_layer) + len(backward_layer))
+
+        return self.finish(None, expanded)
+
+    # Join the forward and backward paths of a bidirectional search through the state key
+    # On symmetric levels both searches may have reached the key through symmetric boards,
+    # then the backward moves are mapped by the symmetry that takes one board onto the other
+    # Returns the solved state if the joined path is a solution, None otherwise
+    def join(self, key, forward, backward):
+        state = self.problem.deepcopy()
+        moves = []
+
+        current = key
+        while forward[current] is not None:
+            parent, u, v, mask = forward[current]
+            moves.append((u, v, mask))
+            current = parent
+        moves.reverse()
+
+        tail = []
+        current = key
+        while backward[current] is not None:
+            u, v, mask, board = backward[current]
+            tail.append((u, v, mask))
+            current = state.canonical(board)
+
+        # Replay the moves, they must not run out of energy nor go through a state twice
+        seen = {state.key()}
+        for u, v, mask in moves:
+            state.apply(u, v, mask)
+            if state.key() in seen:
+                return None
+            seen.add(state.key())
+
+        # Board the backward search reached the key with
+        if backward[key] is None:
+            board = state.goal_board
+        else:
+            u, v, mask, parent = backward[key]
+            board = parent ^ ((mask << (BITS * u)) | (mask << (BITS * v)))
+
+        if board != state.board:
+            permutation = state.symmetry(board, state.board)
+            tail = [(permutation[u], permutation[v], mask) for u, v, mask in tail]
+
+        for u, v, mask in tail:
+            state.apply(u, v, mask)
+            if state.key() in seen:
+                return None
+            seen.add(state.key())
+
+        if state.energy < 0:
+            return None
+
+        return self.adopt(moves + tail)
 
     # Solve the game using Iterative Deepening Search algorithm
+    # A single working state is mutated with apply/undo along the current path, and only the keys
+    # of the states on that path are kept (to skip moves that go back onto it), so memory only grows
+    # with the depth; states reached through several paths are searched once per path
     def solve_ids(self):
-        start = time.time()
-        depth = 0
+        self.begin()
+        state = self.problem.deepcopy()
+        expanded = 0
+        stats = self.stats
+
+        if state.is_goal():
+            return self.finish(self.adopt([]), 0)
+
+        # Moves from the working state that do not lead back onto the current path
+        def successors():
+            moves = []
+
+            start = perf_counter()
+            next_moves = state.gen_moves()
+            stats.gen_time += perf_counter() - start
+
+            for u, v, mask in next_moves:
+                state.apply(u, v, mask)
+                stats.generated += 1
+
+                if state.key() in on_path:
+                    stats.duplicates += 1
+                elif state.dead():
+                    stats.energy_pruned += 1
+                else:
+                    moves.append((u, v, mask))
+
+                state.undo()
+
+            return moves
+
+        for depth in range(1, 1000):
+            on_path = {state.key()}
+            cutoff = False  # Some state was left unexpanded because of the depth limit
+
+            # Moves left to explore at each level of the current path, and the path itself
+            stack = [successors()]
+            path = []
+
+            while stack:
+                if not self.check(expanded, len(stack), depth, state):
+                    return self.finish(None, expanded)  # Budget exceeded or cancelled
+
+                moves = stack[-1]
+
+                # Backtrack, undoing the move that led to this level
+                if not moves:
+                    stack.pop()
+                    if path:
+                        path.pop()
+                        on_path.discard(state.key())
+                        state.undo()
+                    continue
+
+                u, v, mask = moves.pop()  # Pop the last move (DFS)
+                state.apply(u, v, mask)
+                expanded += 1
+                path.append((u, v, mask))
+
+                if state.is_goal():
+                    return self.finish(self.adopt(path), expanded)
+
+                if len(path) < depth:
+                    on_path.add(state.key())
+                    stack.append(successors())
+                    stats.peak_frontier = max(stats.peak_frontier, sum(map(len, stack)))
+                else:
+                    cutoff = True
+                    path.pop()
+                    state.undo()
+
+            # Every path ended before the depth limit, a deeper search would not find more states
+            if not cutoff:
+                break
+
+        return self.finish(None, expanded)
+
+    # Solve the game using IDA* with a transposition table
+    # Depth-first searches are bounded by the evaluation of the states (State.eval),
+    # the bound growing to the smallest evaluation that exceeded it in the previous search
+    # The transposition table keeps the best g seen for each state key, up to table_size entries,
+    # so that states reached again through a worse path are not searched twice
+    def solve_idastar(self, table_size=1 << 20):
+        self.begin()
+        state = self.problem.deepcopy()
+
+        if state.is_goal():
+            return self.finish(self.adopt([]), 0)
+
+        bound = state.eval()
+        table = {state.key(): (0, 0)}
+        iteration = 0
+        expanded = 0
+        stats = self.stats
+
+        # Moves worth exploring from the working state, best evaluation last
+        def successors():
+            nonlocal next_bound
+            moves = []
+
+            start = perf_counter()
+            next_moves = state.gen_moves()
+            stats.gen_time += perf_counter() - start
+
+            for u, v, mask in next_moves:
+                state.apply(u, v, mask)
+                stats.generated += 1
+
+                if state.dead():
+                    stats.energy_pruned += 1
+                    state.undo()
+                    continue
+
+                start = perf_counter()
+                eval = state.eval()
+                stats.eval_time += perf_counter() - start
+
+                key = state.key()
+                g = state.initial_energy - state.energy
+                seen = table.get(key)
 
-        while depth < 1000:
-            print(f"Depth: {depth}")
+                if eval > bound:
+                    stats.bound_pruned += 1
+                    next_bound = min(next_bound, eval)
+                elif seen is None or g < seen[0] or (g == seen[0] and seen[1] < iteration):
+                    if seen is not None or len(table) < table_size:
+                        table[key] = (g, iteration)
+                    moves.append((eval, u, v, mask))
+                else:
+                    stats.duplicates += 1
 
-            visited = set({self.problem.hash()})
-            depth_map = {self.problem.hash(): 0}
-            self.solution[self.problem.hash()] = (-1, -1)
-            stack = [self.problem]
+                state.undo()
+
+            moves.sort(reverse=True)
+            return moves
+
+        while bound < 1e9:
+            iteration += 1
+            next_bound = 1e9
+
+            # Moves left to explore at each level of the current path, and the path itself
+            stack = [successors()]
+            path = []
 
             while stack:
-                now = time.time()
+                if not self.check(expanded, len(stack), bound, state):
+                    return self.finish(None, expanded)  # Budget exceeded or cancelled
+
+                moves = stack[-1]
+
+                # Backtrack, undoing the move that led to this level
+                if not moves:
+                    stack.pop()
+                    if path:
+                        path.pop()
+                        state.undo()
+                    continue
 
-                if now - start > 15:
-                    break  
+                _, u, v, mask = moves.pop()
+                state.apply(u, v, mask)
+                expanded += 1
+                path.append((u, v, mask))
 
-                current = stack.pop()  # Pop the last element (DFS)
+                if state.is_goal():
+                    return self.finish(self.adopt(path), expanded)
 
-                if current.is_goal():
-                    return current
+                stack.append(successors())
+                stats.peak_frontier = max(stats.peak_frontier, sum(map(len, stack)))
 
-                if depth_map[current.hash()] >= depth:
+            bound = next_bound
+
+        return self.finish(None, expanded)
+
+    # Solve the game by racing several algorithms in a pool of processes
+    # Returns the first solution found and terminates the other searches,
+    # or if best is set waits for all of them and keeps the one with the most energy left
+    # The algorithm that produced the solution is stored in self.winner
+    def solve_portfolio(self, portfolio=PORTFOLIO, processes=None, best=False):
+        self.begin()
+        processes = processes or min(len(portfolio), mp.cpu_count())
+        tasks = [(self.problem, self.budget, method, weight) for method, weight in portfolio]
+        solution = None
+        self.winner = None
+
+        with mp.Pool(processes) as pool:
+            pending = pool.imap_unordered(solve_worker, tasks)
+            done = 0
+            expanded = 0
+
+            # Progress counts the nodes expanded by the algorithms that finished and the algorithms still running
+            # Every algorithm applies the node limit to its own search, so it is not checked on the total here
+            while done < len(tasks) and self.poll(expanded, len(tasks) - done, None, None, False):
+                try:
+                    method, weight, moves, stats = pending.next(timeout=0.1)
+                except mp.TimeoutError:
                     continue
 
-                next_moves = current.gen_moves()
+                done += 1
+                expanded += stats.expanded
+                if moves is None:
+                    continue
 
-                for u, v, colors in next_moves:
-                    new_state = current.deepcopy()
-                    new_state.move(u, v, colors)
-                    hash = new_state.hash()
+                state = self.problem.deepcopy()
+                for u, v, mask in moves:
+                    state.apply(u, v, mask)
 
-                    if hash in visited or new_state.energy < 0:
-                        continue
+                if solution is None or state.energy > solution.energy:
+                    solution = state
+                    chosen = moves
+                    chosen_stats = stats
+                    self.winner = (method, weight)
 
-                    depth_map[hash] = depth_map[current.hash()] + 1
+                if not best:
+                    break  # Leaving the pool terminates the remaining workers
 
-                    stack.append(new_state)
-                    visited.add(hash)
-                    self.solution[hash] = (
-                        current.hash(),
-                        u,
-                        v,
-                        colors,
-                        new_state.energy,
-                    )
+        if solution is None:
+            return self.finish(None, expanded)
+
+        solved = self.finish(self.adopt(chosen), expanded)
+
+        # Report the statistics of the search that produced the solution
+        self.stats = self.result.stats = chosen_stats
+        return solved
+
+    # Solve the game using hash-distributed A* (HDA*) over several processes
+    # Every state is owned by the worker its key hashes to, and successors are sent to their owners
+    # The cost of the best solution found is shared, so that workers prune nodes that cannot improve it
+    # The search ends when every worker is idle and every batch sent was received,
+    # observed twice in a row with the same counters
+    def solve_hdastar(self, workers=None, batch=16):
+        self.begin()
+        workers = workers or mp.cpu_count()
+
+        inboxes = [mp.Queue() for _ in range(workers)]
+        results = mp.Queue()
+        sent = mp.Array("q", workers + 1, lock=False)  # Last one is the root, sent from here
+        received = mp.Array("q", workers, lock=False)
+        idle = mp.Array("b", workers, lock=False)
+        expansions = mp.Array("q", workers, lock=False)
+        incumbent = mp.Value("d", 1e9)
+        stop = mp.Event()
+
+        problem = self.problem
+        root = (problem.eval(), problem.heuristic(), *problem.node(), ())
+        sent[workers] = 1
+        inboxes[hda_owner(problem.key(), workers)].put([root])
+
+        processes = [
+            mp.Process(
+                target=hda_worker,
+                args=(
+                    i,
+                    problem,
+                    inboxes,
+                    results,
+                    sent,
+                    received,
+                    idle,
+                    expansions,
+                    incumbent,
+                    stop,
+                    batch,
+                    State.weight,
+                ),
+                daemon=True,
+            )
+            for i in range(workers)
+        ]
+        for process in processes:
+            process.start()
+
+        best = None
+        snapshot = None
+
+        # Progress counts the nodes expanded and the batches of nodes in flight between workers
+        while self.poll(sum(expansions), sum(sent) - sum(received), incumbent.value, None):
+            try:
+                g, path = results.get(timeout=0.01)
+                if best is None or g < best[0]:
+                    best = (g, path)
+                continue
+            except Empty:
+                pass
+
+            current = (all(idle), sum(sent), sum(received))
+            if current[0] and current[1] == current[2] and current == snapshot:
+                break  # Every worker ran out of nodes
 
-            depth += 1
+            snapshot = current
 
-        return None
+        stop.set()
 
-    # Get the solution path from the solved state
+        # Collect the solutions still on their way while the workers finish
+        while any(process.is_alive() for process in processes) or not results.empty():
+            try:
+                g, path = results.get(timeout=0.01)
+                if best is None or g < best[0]:
+                    best = (g, path)
+            except Empty:
+                pass
+
+        for process in processes:
+            process.join()
+
+        if best is None:
+            return self.finish(None, sum(expansions))
+
+        return self.finish(self.adopt(best[1]), sum(expansions))
+
+    # Record a path of moves from the problem in the parent store
+    # Used by searches that do not keep a parent for every state they generate
+    def adopt(self, moves):
+        state = self.problem.deepcopy()
+        parent = self.solution.add(state.key())
+
+        for u, v, mask in moves:
+            state.apply(u, v, mask)
+            parent = self.solution.add(state.key(), parent, u, v, mask)
+
+        return state
+
+    # Get the solution path from the solved state, as (parent key, u, v, colors, energy) moves
+    # The parent store only keeps the moves, so they are replayed from the problem for the rest
     def get_solution(self, solved: State):
         if solved is None:
             return None
 
-        current = solved.hash()
+        state = self.problem.deepcopy()
         path = []
 
-        while current != -1:
-            path.append(self.solution[current])
-            current = self.solution[current][0]
+        for u, v, mask in self.solution.path(solved.key()):
+            parent = state.key()
+            state.apply(u, v, mask)
+
+            # Moves are stored with packed colors, unpack them for the caller
+            path.append((parent, u, v, list(unpacked[mask]), state.energy))
 
-        path.pop()
-        return path[::-1]  # reverse the path
+        return path
 
     # Print the solution path
     def print_solution(self, solved: State):
@@ -167,3 +1020,10 @@ class Solver:
 
         for _, u, v, colors, energy in path:
             print(f"Move {get_color(colors)} from {u} to {v}   Energy: {energy}")
+
+
+# Solve levels without the GUI, see cli.py
+if __name__ == "__main__":
+    from cli import main
+
+    main()
@@ -1,51 +1,108 @@
-from itertools import permutations
-from copy import deepcopy
+import os
+from graph import BOARD, UNREACHABLE, level_graph
+from patterns import PatternHeuristic
 from utils import *
 
 
 # Represent the state of the game
+# The colors of the board are packed into a single integer (BITS bits per vertex)
+# and the pigments, which never move, into another one, so copying a state is cheap
 class State:
-    # Initialize the state
-    def __init__(self, st=None):
-        self.al = adjacency_list
-
+    __slots__ = (
+        "topology",
+        "n",
+        "board",
+        "initial_board",
+        "goal_board",
+        "pigments",
+        "energy",
+        "initial_energy",
+        "moves",
+        "last_move",
+        "history",
+        "masks",
+        "goal_masks",
+        "h",
+        "patterns",
+        "symmetries",
+    )
+
+    # Constants for the colors and pigments (negative values)
+    RED = 1
+    GREEN = 2
+    BLUE = 3
+    PRED = -1
+    PGREEN = -2
+    PBLUE = -3
+
+    # Weight of the heuristic in the evaluation (weighted A*)
+    weight = 5
+
+    # Combine the heuristic with the pattern databases of the level (see patterns.py)
+    # Off by default: on the bundled levels the databases take seconds to build and rarely beat the matching bound
+    use_patterns = False
+
+    # Treat boards that a symmetry of the level maps onto each other as one state (see find_symmetries)
+    # Off by default: every key then permutes the board once per symmetry, which only pays off when the searches
+    # actually meet symmetric boards, as the backward search from a symmetric goal does
+    use_symmetries = False
+
+    # Initialize the state, on the original board unless another graph is given
+    def __init__(self, st=None, topology=BOARD):
         # Initialize the rest of the variables
         # If st is not None, copy the values from parameter st - used for deepcopy
         # Otherwise, initialize the variables with default values
         if st is not None:
+            self.topology = st.topology
             self.n = st.n
-            self.graph = deepcopy(st.graph)
-            self.initial_graph = deepcopy(st.graph)
-            self.goal = deepcopy(st.goal)
+            self.board = st.board
+            self.initial_board = st.initial_board
+            self.goal_board = st.goal_board
+            self.pigments = st.pigments
             self.energy = st.energy
             self.initial_energy = st.initial_energy
             self.moves = st.moves
-            self.apsp = st.apsp
             self.last_move = st.last_move
+            self.history = []
+            self.masks = st.masks
+            self.goal_masks = st.goal_masks
+            self.h = st.h
+            self.patterns = st.patterns
+            self.symmetries = st.symmetries
         else:
-            self.n = 19
-            self.graph = [set() for _ in range(self.n)]
-            self.initial_graph = [set() for _ in range(self.n)]
-            self.goal = [set() for _ in range(self.n)]
+            self.topology = topology
+            self.n = topology.n
+            self.board = 0
+            self.initial_board = 0
+            self.goal_board = 0
+            self.pigments = 0
             self.energy = 0
             self.initial_energy = 0
             self.moves = 0
-            self.apsp = self.floyd_warshall()
-            self.last_move = (None, None, None, None)
-
-        # Constants for the colors and pigments (negative values)
-        self.RED = 1
-        self.GREEN = 2
-        self.BLUE = 3
-        self.PRED = -1
-        self.PGREEN = -2
-        self.PBLUE = -3
+            self.last_move = (None, None, None, None, None)
+            self.history = []
+            self.masks = (0, 0, 0)
+            self.goal_masks = (0, 0, 0)
+            self.h = None
+            self.patterns = None
+            self.symmetries = ()
 
     # Set the level of the game, read the initial and goal states from the files
     def set_level(self, level):
+        self.load_level(f"./levels/{level}")
+
+    # Read the initial and goal states of a level from the files in its directory
+    # The level is played on the graph in its graph.txt file, or on the original board
+    def load_level(self, directory):
+        self.topology = level_graph(directory)
+        self.n = self.topology.n
+
+        graph = [set() for _ in range(self.n)]
+        goal = [set() for _ in range(self.n)]
+
         # Initialize the graph with the colors
-        # Read file 'initial.txt' from ./levels/level
-        with open(f"./levels/{level}/initial.txt", "r") as f:
+        # Read file 'initial.txt' from the level directory
+        with open(f"{directory}/initial.txt", "r") as f:
             for i, line in enumerate(f):
                 if i == 0:
                     self.energy = int(line)  # First line is the energy
@@ -53,41 +110,108 @@ class State:
                     continue
                 for element in line.split():
                     if element != "0":
-                        self.graph[i - 1].add(int(element))
+                        graph[i - 1].add(int(element))
 
         # Initialize the goal with the colors
-        # Read file 'goal.txt' from ./levels/level
-        with open(f"./levels/{level}/goal.txt", "r") as f:
+        # Read file 'goal.txt' from the level directory
+        with open(f"{directory}/goal.txt", "r") as f:
             for i, line in enumerate(f):
                 for element in line.split():
                     if element != "0":
-                        self.goal[i].add(int(element))
+                        goal[i].add(int(element))
+
+        self.board, self.pigments = pack_graph(graph)
+        self.initial_board = self.board
+        self.goal_board, _ = pack_graph(goal)
+
+        self.masks = color_masks(self.board, self.n)
+        self.goal_masks = color_masks(self.goal_board, self.n)
+        self.h = None
+
+        self.symmetries = self.find_symmetries() if self.use_symmetries else ()
+
+        # The pattern databases are built on first use and cached next to the level
+        self.patterns = None
+        if self.use_patterns:
+            self.patterns = PatternHeuristic(self, f"{directory}/patterns.pickle")
+
+    # Write the initial and goal states to the files of a level directory, in the format read by load_level
+    def save_level(self, directory):
+        os.makedirs(directory, exist_ok=True)
+
+        if self.topology is not BOARD:
+            self.topology.save(f"{directory}/graph.txt")
+
+        initial = unpack_graph(self.initial_board, self.pigments, self.n)
+        with open(f"{directory}/initial.txt", "w") as f:
+            f.write(f"{self.initial_energy}\n")
+            for colors in initial:
+                f.write(" ".join(map(str, sorted(colors, key=abs))) or "0")
+                f.write("\n")
+
+        with open(f"{directory}/goal.txt", "w") as f:
+            for colors in self.goal:
+                f.write(" ".join(map(str, sorted(colors, key=abs))) or "0")
+                f.write("\n")
+
+    # Current board as a list of sets of colors, pigments included (negative values)
+    @property
+    def graph(self):
+        return unpack_graph(self.board, self.pigments, self.n)
+
+    # Goal board as a list of sets of colors, pigments included (negative values)
+    @property
+    def goal(self):
+        return unpack_graph(self.goal_board, self.pigments, self.n)
+
+    # Get the packed colors of vertex u
+    def colors(self, u):
+        return (self.board >> (BITS * u)) & VERTEX_MASK
+
+    # Get the packed colors and pigments that block a move into vertex v
+    def blocked(self, v):
+        return ((self.board | self.pigments) >> (BITS * v)) & VERTEX_MASK
+
+    # Move the packed colors between vertices u and v (in either direction)
+    # The per-color vertex masks are updated through the same delta and the cached heuristic is dropped
+    def flip(self, u, v, mask):
+        self.board ^= (mask << (BITS * u)) | (mask << (BITS * v))
+
+        delta = (1 << u) | (1 << v)
+        red, green, blue = self.masks
+        self.masks = (
+            red ^ delta if mask & 1 else red,
+            green ^ delta if mask & 2 else green,
+            blue ^ delta if mask & 4 else blue,
+        )
+        self.h = None
 
     # Check if the move is valid
     def valid_move(self, u, v, colors):
         if u < 0 or u >= self.n or v < 0 or v >= self.n:
             return False
 
-        # Filter the colors that are not pigments
-        filtered = list(filter(lambda color: color > 0, self.graph[u]))
+        # Colors that are in vertex u (pigments are stored separately)
+        filtered = self.colors(u)
 
-        if len(colors) == 2 and len(filtered) == 3:
+        if len(colors) == 2 and popcount[filtered] == 3:
             return False  # Cannot move two colors from a vertex with 3 colors
 
         if u == v:
             return True  # Simplifies code
 
+        if not self.topology.masks[u] >> v & 1:
+            return False
+
         for color in colors:
-            if color < 1 or color > 3 or v not in self.al[u]:
+            if color < 1 or color > 3:
                 return False
 
-            # Check if the color or its pigment is not in the destination vertex
-            if (
-                color not in self.graph[u]
-                or color in self.graph[v]
-                or -color in self.graph[v]
-            ):
-                return False
+        # Check if the colors are in the source and neither the colors
+        # nor their pigments are in the destination vertex
+        mask = pack_colors(colors)
+        if mask & ~filtered or mask & self.blocked(v):
+            return False
 
         return True
 
@@ -101,181 +225,291 @@ class State:
         if not self.valid_move(u, v, colors):
             return False
 
-        filtered = list(filter(lambda color: color > 0, self.graph[u]))
+        self.apply(u, v, pack_colors(colors))
+
+        return True
+
+    # Apply a move of the packed colors in mask from vertex u to vertex v
+    # The move must be valid, like the ones produced by gen_moves
+    def apply(self, u, v, mask):
+        filtered = popcount[self.colors(u)]
 
         energy_before = self.energy
+        h_before = self.h
 
-        # Moving from a vertex with 3 colors requires 3 energy to split the colors
-        if len(colors) == 1 and len(filtered) == 3:
-            self.energy -= 3
+        if popcount[mask] == 1:
+            # Moving from a vertex with 3 colors requires 3 energy to split the colors
+            if filtered == 3:
+                self.energy -= 3
 
-        # Moving from a vertex with 2 colors requires 1 energy to split the colors
-        # Need to verify if is not an ongoing move (u had initially 3 colors and now has 2)
-        # If it is, do not consume energy
-        if len(colors) == 1 and len(filtered) == 2 and not u == self.last_move[0]:
-            self.energy -= 1
+            # Moving from a vertex with 2 colors requires 1 energy to split the colors
+            # Need to verify if is not an ongoing move (u had initially 3 colors and now has 2)
+            # If it is, do not consume energy
+            elif filtered == 2 and not u == self.last_move[0]:
+                self.energy -= 1
+
+        self.flip(u, v, mask)
 
-        for color in colors:
-            self.graph[u].remove(color)
-            self.graph[v].add(color)
-            
         self.energy -= 1
         self.moves += 1
 
-        # Save the last move
-        self.last_move = (u, v, colors, energy_before)
+        # Save the last move, and the previous one so that it can be undone
+        self.history.append(self.last_move)
+        self.last_move = (u, v, mask, energy_before, h_before)
 
-        return True
-
-    # Undo the last move
+    # Undo the last move, restoring the energy, the move count, the cached heuristic
+    # and the move before it, so that moves can be undone all the way back
+    # Used by the player, to navigate through the solution path and by in-place searches
     def undo(self):
         if self.last_move[0] is None:
             return False
 
-        (u, v, colors, energy) = self.last_move
+        (u, v, mask, energy, h) = self.last_move
 
-        for color in colors:
-            self.graph[u].add(color)
-            self.graph[v].remove(color)
+        self.flip(u, v, mask)
 
         self.energy = energy
-        self.last_move = None
+        self.moves -= 1
+        self.h = h
+        self.last_move = self.history.pop() if self.history else (None,) * 5
 
         return True
 
-    # Reverse a given move
-    # Used to navigate through the solution path
-    def reverse_move(self, u, v, colors, energy):
-        for color in colors:
-            self.graph[u].add(color)
-            self.graph[v].remove(color)
-
-        self.moves -= 1
-        self.energy = energy
-
     # Reset the state to the initial state
     def reset(self):
         self.energy = self.initial_energy
         self.moves = 0
-        self.last_move = None
-        self.graph = deepcopy(self.initial_graph)
+        self.last_move = (None, None, None, None, None)
+        self.history = []
+        self.board = self.initial_board
+        self.masks = color_masks(self.board, self.n)
+        self.h = None
 
     # Check if the current state is the goal state
     def is_goal(self):
-        return self.graph == self.goal
+        return self.board == self.goal_board
 
-    # Generate all possible moves from the current state
+    # Generate all possible moves from the current state, as (u, v, packed colors)
+    # The legal subsets of colors for each edge are looked up in move_table
     def gen_moves(self):
         moves = []
+        board = self.board
+        blocked = board | self.pigments
+        offsets, targets = self.topology.offsets, self.topology.targets
+
         for u in range(self.n):
-            for v in self.al[u]:
-                valid = filter(lambda color: color > 0, self.graph[u])
-                subsets = all_substets(list(valid))
-
-                for subset in subsets:
-                    subset = list(subset)
-                    if self.valid_move(u, v, subset):
-                        moves.append((u, v, subset))
+            content = (board >> (BITS * u)) & VERTEX_MASK
+            if not content:
+                continue
+
+            table = move_table[content]
+            for v in targets[offsets[u] : offsets[u + 1]]:
+                for mask in table[(blocked >> (BITS * v)) & VERTEX_MASK]:
+                    moves.append((u, v, mask))
+        return moves
+
+    # Generate all the moves that lead to the current state, as (u, v, packed colors)
+    # Flipping one of them (see flip) gives a state from which it is a legal move
+    # Energy is not tracked, this is meant for searches going backward from the goal
+    def gen_reverse_moves(self):
+        moves = []
+        board = self.board
+        pigments = self.pigments
+        offsets, targets = self.topology.offsets, self.topology.targets
+
+        for v in range(self.n):
+            content = (board >> (BITS * v)) & VERTEX_MASK
+            if not content:
+                continue
+
+            pigment = (pigments >> (BITS * v)) & VERTEX_MASK
+            for u in targets[offsets[v] : offsets[v + 1]]:
+                before = (board >> (BITS * u)) & VERTEX_MASK
+                blocked = before | (pigments >> (BITS * u)) & VERTEX_MASK
+
+                for mask in subsets[content]:
+                    # The colors must fit back in u, and the move must be legal from there
+                    if not mask & blocked and mask in move_table[before | mask][(content ^ mask) | pigment]:
+                        moves.append((u, v, mask))
         return moves
 
+    # Compact search node: the parts of the state that change between moves
+    # States of the same problem can be restored from it with load
+    def node(self):
+        return (self.board, self.masks, self.energy, self.last_move[0])
+
+    # Restore a search node produced by node
+    def load(self, board, masks, energy, last):
+        self.board = board
+        self.masks = masks
+        self.energy = energy
+        self.last_move = (last, None, None, None, None)
+        self.h = None
+
     # Transform the state to a string
     def __str__(self):
         return str(self.graph)
 
-    # Deepcopy the state to avoid reference issues
+    # Copy the state, the packed boards are immutable integers and can be shared
     def deepcopy(self):
         return State(self)
 
+    # Automorphisms of the graph, other than the identity, that map the pigments and the goal onto themselves
+    # Boards that one of them maps onto each other have the same moves, costs and distance to the goal
+    # Each one is kept as (permutation, permutation tables), the tables permute whole boards quickly
+    def find_symmetries(self):
+        symmetries = []
+        for permutation in self.topology.automorphisms[1:]:
+            tables = permutation_tables(permutation)
+            if (
+                permute_board(self.pigments, tables) == self.pigments
+                and permute_board(self.goal_board, tables) == self.goal_board
+            ):
+                symmetries.append((permutation, tables))
+        return tuple(symmetries)
+
+    # Key of the state, used for duplicate detection and solution reconstruction
+    # The packed board is canonical (one integer per board), so it is its own key, unless the level is symmetric:
+    # then symmetric boards share the key of the smallest of them
+    def key(self):
+        if not self.symmetries:
+            return self.board
+        return self.canonical(self.board)
+
+    # Key of a board of this level: the smallest of its symmetric boards
+    def canonical(self, board):
+        if not self.symmetries:
+            return board
+        return min(board, *(permute_board(board, tables) for _, tables in self.symmetries))
+
+    # Symmetry of the level that maps the board source onto the board target, None if there is none
+    # The identity is returned as None too, so that callers only map moves when they have to
+    def symmetry(self, source, target):
+        for permutation, tables in self.symmetries:
+            if permute_board(source, tables) == target:
+                return permutation
+        return None
+
     # Hash the state
-    def hash(self):
-        return str(self.graph).__hash__()
+    def __hash__(self):
+        return hash(self.board)
 
     # Compare two states for equality
     def __eq__(self, other):
-        return self.graph == other.graph
-
-    # Floyd-Warshall algorithm to compute the all-pairs shortest path
-    # Distance from vertex u to vertex v is stored in apsp[u][v]
-    def floyd_warshall(self):
-        apsp = [[0 for _ in range(self.n)] for _ in range(self.n)]
-        for u in range(self.n):
-            for v in range(self.n):
-                if u == v:
-                    continue
-                if v in self.al[u]:
-                    apsp[u][v] = 1
-                else:
-                    apsp[u][v] = 1e9
-
-        for k in range(self.n):
-            for u in range(self.n):
-                for v in range(self.n):
-                    apsp[u][v] = min(apsp[u][v], apsp[u][k] + apsp[k][v])
-
-        return apsp
-
-    # For a given color, find the minimum sum of distances from the vertices with that color in the current state
-    # to the vertices with that color in the goal state
-    def best_distance(self, color):
-        # Color is a set of colors
-        from_graph = []
-        for i in range(self.n):
-            if color.intersection(self.graph_copy[i]) == color:
-                from_graph.append(i)
-
-        from_goal = []
-        for i in range(self.n):
-            if color.intersection(self.goal_copy[i]) == color:
-                from_goal.append(i)
-
-        if len(from_graph) != len(from_goal):
-            return 0
-
-        # Remove common vertices
-        for i in range(self.n):
-            if i in from_graph and i in from_goal:
-                from_graph.remove(i)
-                from_goal.remove(i)
-
-        # Find best mapping from from_graph to from_goal such that the sum of distances is minimized
-        # Distances are stored in self.apsp
-        # After finding pairs remove them from graph_copy and goal_copy
-
-        best = 1e9
-        for perm in permutations(from_goal):
-            dist = 0
-            for i in range(len(perm)):
-                dist += self.apsp[from_graph[i]][perm[i]]
-            best = min(best, dist)
-
-        for i in range(len(from_graph)):
-            for c in color:
-                self.graph_copy[from_graph[i]].remove(c)
-                self.goal_copy[from_goal[i]].remove(c)
-
+        return self.board == other.board
+
+    # Find the minimum sum of distances of a mapping from the vertices in mask a
+    # to the vertices in mask b, both with the same number of vertices
+    # Results only depend on the masks and the graph, so they are memoized in the graph
+    def best_distance(self, a, b):
+        distances = self.topology.distances
+        key = (a, b)
+        if key in distances:
+            return distances[key]
+
+        # Optimal assignment over the shortest path distances of the graph
+        apsp = self.topology.apsp
+        from_goal = list(bits(b))
+        best = hungarian(
+            [[apsp[u][v] for v in from_goal] for u in bits(a)]
+        )
+
+        distances[key] = best
         return best
 
-    # Evaluate the state for the priority queue in the A* algorithm
-    def eval(self):
-        # g is the cost of the path from the initial state to the current state
-        g = self.initial_energy - self.energy
+    # Heuristic: for each combination of colors, from white down to the primary colors,
+    # the minimum sum of distances from the vertices with that combination in the current state
+    # to the vertices with that combination in the goal state
+    # It is computed from the per-color vertex masks and cached until the next move
+    def heuristic(self):
+        if self.h is not None:
+            return self.h
 
-        # h is the sum of the max distance from a color in the goal to the vertex with that color in current state
         h = 0
+        current = list(self.masks)
+        goal = list(self.goal_masks)
+
+        for combination in color_classes:
+            a = -1
+            b = -1
+            for color in bits(combination):
+                a &= current[color]
+                b &= goal[color]
 
-        colors = all_substets([1, 2, 3])
-        colors = list(reversed(list(colors)))
+            if a.bit_count() != b.bit_count():
+                continue
 
-        self.graph_copy = deepcopy(self.graph)
-        self.goal_copy = deepcopy(self.goal)
+            # Remove common vertices
+            common = a & b
+            a ^= common
+            b ^= common
 
-        for color in colors:
-            color = set(color)
-            if color == set():
+            if not a:
                 continue
-            h += self.best_distance(color)
 
-        return g + 5 * h  # Weighted A* algorithm with weight 5
+            h += self.best_distance(a, b)
+
+            # Matched vertices no longer hold this combination for the next ones
+            for color in bits(combination):
+                current[color] &= ~a
+                goal[color] &= ~b
+
+        # The pattern databases bound the moves of each color on its own, keep the tighter estimate
+        if self.patterns is not None:
+            h = max(h, self.patterns.estimate(self.masks))
+
+        self.h = h
+        return h
+
+    # Lower bound on the energy still needed to reach the goal, cheap enough to check on every successor
+    # Every vertex holding a color that it does not hold in the goal must be the source of a move, every vertex
+    # missing one must be the target of a move, and the drops of each color must travel at least their matched
+    # distance, so there are at least as many moves as the largest of the three
+    # White vertices can only be broken up by moving a single color out of them, which costs 3 more energy,
+    # so every white vertex beyond the ones in the goal adds 3
+    # Moves never change the number of drops of a color, so a board with a different number than the goal
+    # cannot reach it, and its bound is UNREACHABLE
+    def energy_bound(self):
+        current = self.masks
+        goal = self.goal_masks
+        sources = 0
+        targets = 0
+        moves = 0
+
+        for color in range(3):
+            if current[color].bit_count() != goal[color].bit_count():
+                return UNREACHABLE
+
+            extra = current[color] & ~goal[color]
+            if not extra:
+                continue
+
+            missing = goal[color] & ~current[color]
+            sources |= extra
+            targets |= missing
+            moves = max(moves, self.best_distance(extra, missing))
+
+        moves = max(moves, sources.bit_count(), targets.bit_count())
+        whites = (current[0] & current[1] & current[2]).bit_count() - (
+            goal[0] & goal[1] & goal[2]
+        ).bit_count()
+
+        return moves + 3 * max(0, whites)
+
+    # Check if the state cannot reach the goal with the energy it has left
+    # The pattern databases bound the moves left too (every move costs energy), and their estimate
+    # is UNREACHABLE for boards whose projection cannot reach the goal, so those are dead as well
+    def dead(self):
+        if self.energy < 0 or self.energy < self.energy_bound():
+            return True
+        return self.patterns is not None and self.energy < self.patterns.estimate(self.masks)
+
+    # Evaluate the state for the priority queue in the A* algorithm
+    def eval(self):
+        # g is the cost of the path from the initial state to the current state
+        g = self.initial_energy - self.energy
+
+        return g + self.weight * self.heuristic()  # Weighted A* algorithm
 
     # Define the less than operator for the priority queue
     def __lt__(self, other):
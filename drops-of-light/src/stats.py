@@ -0,0 +1,86 @@
+import cProfile
+import io
+import pstats
+from time import perf_counter
+
+
+# Define the counters of a search
+# Times are in seconds and are measured around the calls to State.eval, State.gen_moves
+# and the state copies made by the solvers
+class SearchStats:
+    # Initialize the counters, profiling the search with cProfile if profile is set
+    def __init__(self, profile=False):
+        self.generated = 0  # Successors generated
+        self.expanded = 0  # States whose successors were generated
+        self.duplicates = 0  # Successors pruned because they were already reached
+        self.energy_pruned = 0  # Successors pruned because they cannot reach the goal with the energy left
+        self.bound_pruned = 0  # Successors pruned by the evaluation bound (A*, IDA*)
+        self.peak_frontier = 0  # Largest size of the open list
+
+        self.eval_time = 0
+        self.gen_time = 0
+        self.copy_time = 0
+        self.elapsed = 0
+
+        self.profiler = cProfile.Profile() if profile else None
+        self.profile = None
+        self.start = None
+
+    # Start measuring the search
+    def begin(self):
+        self.start = perf_counter()
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    # Stop measuring the search
+    def end(self, expanded):
+        self.expanded = expanded
+        self.elapsed = perf_counter() - self.start
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profile = pstats.Stats(self.profiler)
+
+    # Expanded nodes per second
+    def rate(self):
+        return self.expanded / self.elapsed if self.elapsed else 0
+
+    # Most expensive functions of the profiled search, as text
+    def top(self, limit=20):
+        if self.profile is None:
+            return ""
+
+        stream = io.StringIO()
+        self.profile.stream = stream
+        self.profile.sort_stats("cumulative").print_stats(limit)
+        return stream.getvalue()
+
+    # Counters as a dictionary, for reports
+    def as_dict(self):
+        return {
+            "generated": self.generated,
+            "expanded": self.expanded,
+            "duplicates": self.duplicates,
+            "energy_pruned": self.energy_pruned,
+            "bound_pruned": self.bound_pruned,
+            "peak_frontier": self.peak_frontier,
+            "eval_time": self.eval_time,
+            "gen_time": self.gen_time,
+            "copy_time": self.copy_time,
+            "elapsed": self.elapsed,
+        }
+
+    # Summary of the counters, one line per group
+    def lines(self):
+        return [
+            f"Expanded {self.expanded}  Generated {self.generated}  ({self.rate():.0f} nodes/s)",
+            f"Pruned: {self.duplicates} duplicates  {self.energy_pruned} energy  {self.bound_pruned} bound",
+            f"Peak frontier {self.peak_frontier}",
+            f"Time: eval {self.eval_time:.2f}s  moves {self.gen_time:.2f}s  copies {self.copy_time:.2f}s",
+        ]
+
+    # Pickle the counters without the profiler, which cannot be sent between processes
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["profiler"] = None
+        state["profile"] = None
+        return state
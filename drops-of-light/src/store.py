@@ -0,0 +1,53 @@
+from array import array
+from utils import BITS, VERTEX_MASK
+
+
+# Define the parent pointers of the states reached by a search
+# States are numbered in the order they are added, and two typed arrays hold, for each number,
+# the number of its parent (-1 for the root) and the move that reached it packed into one integer
+# The map from state keys to numbers doubles as the set of reached states
+# Compared with a tuple per state, each state only costs its map entry and 16 bytes of arrays
+class ParentStore:
+    # Initialize an empty store for a graph of n vertices
+    def __init__(self, n):
+        self.n = n
+        self.index = {}
+        self.parents = array("q")
+        self.moves = array("q")
+
+    # Pack a move into one integer: the vertices as u * n + v, then the colors
+    def pack(self, u, v, mask):
+        return (u * self.n + v) << BITS | mask
+
+    # Unpack a move packed by pack
+    def unpack(self, code):
+        u, v = divmod(code >> BITS, self.n)
+        return u, v, code & VERTEX_MASK
+
+    # Add a state reached from the state numbered parent with a move, or the root if there is no parent
+    # Returns the number of the state
+    def add(self, key, parent=-1, u=0, v=0, mask=0):
+        number = len(self.parents)
+        self.index[key] = number
+        self.parents.append(parent)
+        self.moves.append(self.pack(u, v, mask))
+        return number
+
+    # Moves from the root to the state with the given key, as (u, v, packed colors)
+    def path(self, key):
+        moves = []
+        number = self.index[key]
+
+        while self.parents[number] != -1:
+            moves.append(self.unpack(self.moves[number]))
+            number = self.parents[number]
+
+        return moves[::-1]
+
+    # Check if a state was reached
+    def __contains__(self, key):
+        return key in self.index
+
+    # Number of states reached
+    def __len__(self):
+        return len(self.parents)
@@ -66,3 +66,188 @@ rgb = {
     "White": (255, 255, 255),
 }
 
+
+
+# Each vertex of a packed board stores its colors in 3 bits, one per primary color
+BITS = 3
+VERTEX_MASK = (1 << BITS) - 1
+
+
+# Get the bit of a color (or pigment) inside a vertex field
+def color_bit(color):
+    return 1 << (abs(color) - 1)
+
+
+# Pack a collection of colors into a vertex field
+def pack_colors(colors):
+    field = 0
+    for color in colors:
+        field |= color_bit(color)
+    return field
+
+
+# Colors held by each possible vertex field
+unpacked = [
+    tuple(color for color in (1, 2, 3) if field & color_bit(color))
+    for field in range(VERTEX_MASK + 1)
+]
+
+# Number of colors held by each possible vertex field
+popcount = [len(colors) for colors in unpacked]
+
+
+# Pack a list of sets of colors (and pigments) into two integers, one for each
+def pack_graph(graph):
+    board, pigments = 0, 0
+    for i, colors in enumerate(graph):
+        board |= pack_colors(filter(lambda color: color > 0, colors)) << (BITS * i)
+        pigments |= pack_colors(filter(lambda color: color < 0, colors)) << (BITS * i)
+    return board, pigments
+
+
+# Unpack a board and its pigments into a list of sets of colors
+def unpack_graph(board, pigments, n):
+    graph = []
+    for i in range(n):
+        colors = set(unpacked[(board >> (BITS * i)) & VERTEX_MASK])
+        for color in unpacked[(pigments >> (BITS * i)) & VERTEX_MASK]:
+            colors.add(-color)
+        graph.append(colors)
+    return graph
+
+
+# Color combinations matched by the heuristic, from white down to the primary colors
+color_classes = [
+    pack_colors(colors) for colors in reversed(list(all_substets([1, 2, 3]))) if colors
+]
+
+
+# Iterate over the indices of the bits set in a mask
+def bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+# Split a packed board into one vertex mask per primary color
+def color_masks(board, n):
+    masks = [0, 0, 0]
+    for i in range(n):
+        field = (board >> (BITS * i)) & VERTEX_MASK
+        for color in unpacked[field]:
+            masks[color - 1] |= 1 << i
+    return tuple(masks)
+
+
+# Number of vertices a permutation table covers, each table has 2^(BITS * PERMUTATION_SPAN) entries
+PERMUTATION_SPAN = 3
+
+
+# Lookup tables that move the field of every vertex u of a packed board to vertex permutation[u]
+# The board is split into runs of PERMUTATION_SPAN vertices, and each table maps the fields of one run
+# to their permuted positions, so permuting a board takes one lookup per run instead of one step per vertex
+def permutation_tables(permutation):
+    tables = []
+    for first in range(0, len(permutation), PERMUTATION_SPAN):
+        span = permutation[first : first + PERMUTATION_SPAN]
+        table = []
+        for fields in range(1 << (BITS * len(span))):
+            permuted = 0
+            for i, v in enumerate(span):
+                permuted |= ((fields >> (BITS * i)) & VERTEX_MASK) << (BITS * v)
+            table.append(permuted)
+        tables.append(table)
+    return tables
+
+
+# Apply a permutation, given by its permutation_tables, to a packed board
+def permute_board(board, tables):
+    permuted = 0
+    mask = (1 << (BITS * PERMUTATION_SPAN)) - 1
+    for table in tables:
+        permuted |= table[board & mask]
+        board >>= BITS * PERMUTATION_SPAN
+    return permuted
+
+
+# Hungarian algorithm, minimum cost of a perfect matching in a square cost matrix
+# Runs in O(n^3) using row/column potentials and shortest augmenting paths
+def hungarian(cost):
+    n = len(cost)
+    inf = float("inf")
+
+    # Potentials of rows (u) and columns (v), p[j] is the row matched to column j
+    # Rows and columns are 1-indexed, column 0 is a virtual column used for augmentation
+    u = [0] * (n + 1)
+    v = [0] * (n + 1)
+    p = [0] * (n + 1)
+    way = [0] * (n + 1)
+
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = [inf] * (n + 1)
+        used = [False] * (n + 1)
+
+        # Grow the alternating tree until a free column is reached
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            delta = inf
+            j1 = 0
+
+            for j in range(1, n + 1):
+                if used[j]:
+                    continue
+                cur = cost[i0 - 1][j - 1] - u[i0] - v[j]
+                if cur < minv[j]:
+                    minv[j] = cur
+                    way[j] = j0
+                if minv[j] < delta:
+                    delta = minv[j]
+                    j1 = j
+
+            for j in range(n + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+
+            j0 = j1
+            if p[j0] == 0:
+                break
+
+        # Flip the augmenting path
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    return sum(cost[p[j] - 1][j - 1] for j in range(1, n + 1))
+
+
+# Legal moves out of a vertex, indexed by the packed colors of the vertex and
+# the packed colors and pigments of the destination: the subsets of colors that can be moved,
+# in the order they were historically generated (by size, then by color)
+move_table = [
+    [
+        tuple(
+            pack_colors(subset)
+            for subset in all_substets(unpacked[content])
+            if subset
+            and not pack_colors(subset) & blocked
+            and not (len(subset) == 2 and popcount[content] == 3)
+        )
+        for blocked in range(VERTEX_MASK + 1)
+    ]
+    for content in range(VERTEX_MASK + 1)
+]
+
+
+# Non-empty subsets of the colors of each possible vertex field, in the same order as move_table
+subsets = [
+    tuple(pack_colors(subset) for subset in all_substets(unpacked[field]) if subset)
+    for field in range(VERTEX_MASK + 1)
+]